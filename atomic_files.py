@@ -0,0 +1,23 @@
+import json
+import os
+
+import numpy as np
+
+############################################################################################################
+################################################ REPLACING FILES ###########################################
+#Saved indexes, columns and checkpoints are read (mostly memory mapped) by chart apps, Ingestors and scans in
+#other processes while they are rebuilt. Each file is written next to its final path and renamed over it, so a
+#reader opens either the old file or the complete new one, never a half written one. Mapped old files keep
+#their pages until they are unmapped.
+
+def replaceFile(path, write, mode = 'wb'): #write(f) fills the file aside, the rename swaps it in
+	tmpPath = path + ".tmp"
+	with open(tmpPath, mode) as f:
+		write(f)
+	os.replace(tmpPath, path)
+
+def saveArray(path, array): #np.save through replaceFile, a file object keeps np.save from adding .npy
+	replaceFile(path, lambda f: np.save(f, array))
+
+def saveJson(path, value):
+	replaceFile(path, lambda f: json.dump(value, f), 'w')
@@ -0,0 +1,117 @@
+import functools
+import os
+import threading
+import time
+import traceback
+
+from flask import jsonify
+
+import instrumentation
+
+############################################################################################################
+################################################ STAGES ####################################################
+#A stage follows the pass it is running through instrumentation's progress hooks: blocks walked on the best
+#chain, bytes of blk files scanned for headers or of text files read, rows of a dataset. Throughput and ETA
+#are for the current pass and come for free from the passes that already exist
+
+class Stage(object):
+
+	def __init__(self, name):
+		self.name = name
+		self.state = "pending" #pending --> running --> done / failed
+		self.done = 0
+		self.total = None
+		self.unit = None
+		self.started = None
+		self.passStarted = None
+		self.finished = None
+
+	def progressHook(self, done, total, unit = "blocks"):
+		if unit != self.unit or done < self.done: #Next pass
+			self.unit = unit
+			self.passStarted = time.time()
+		self.done = done
+		self.total = total
+
+	def status(self):
+		now = time.time()
+		seconds = ((self.finished or now) - self.started) if self.started else 0.0
+		passSeconds = ((self.finished or now) - self.passStarted) if self.passStarted else 0.0
+		status = {"name": self.name, "state": self.state, "done": self.done, "total": self.total, "unit": self.unit,
+			"seconds": round(seconds, 3), "progress": None, "throughput": None, "eta": None}
+		if self.state == "done":
+			status["progress"] = 1.0
+		elif self.total:
+			status["progress"] = round(float(self.done) / self.total, 4)
+		if passSeconds > 0 and self.done:
+			status["throughput"] = round(self.done / passSeconds, 1) #Units per second
+			if self.state == "running" and self.total:
+				status["eta"] = round((self.total - self.done) / (self.done / passSeconds), 1)
+		return status
+
+############################################################################################################
+################################################ BACKGROUND JOB ############################################
+#Runs a module's parsing on a worker thread after the app is already serving. Chart routes decorated with
+#.required answer 202 and the current status until every stage has finished. GET /status reports it anytime.
+#A job that was never started means the data was parsed up front, routes and /status then treat it as ready.
+
+class BackgroundJob(object):
+
+	def __init__(self, app = None):
+		self.stages = []
+		self.ready = threading.Event()
+		self.error = None
+		self.thread = None
+		self.started = None
+		if app is not None:
+			app.add_url_rule("/status", "status", self.statusView)
+
+	def start(self, stages, reloader = False): #stages = [(name, function), ...] run in order on a daemon thread
+		#reloader: the app runs with the Werkzeug reloader (debug = True), whose first process only watches files
+		#and restarts a serving child. Only that child (WERKZEUG_RUN_MAIN set) parses, or both would write the same files.
+		if reloader and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+			return self
+		self.stages = [Stage(name) for name, function in stages]
+		self.started = time.time()
+		self.thread = threading.Thread(target = self.run, args = ([function for name, function in stages],), name = "precompute")
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def run(self, functions):
+		for stage, function in zip(self.stages, functions):
+			stage.state = "running"
+			stage.started = time.time()
+			instrumentation.progressHooks.append(stage.progressHook)
+			try:
+				function()
+			except Exception:
+				stage.state = "failed"
+				self.error = traceback.format_exc()
+				return
+			finally:
+				stage.finished = time.time()
+				instrumentation.progressHooks.remove(stage.progressHook)
+			stage.state = "done"
+		self.ready.set()
+
+	def status(self):
+		if self.ready.is_set() or self.thread is None:
+			state = "ready"
+		else:
+			state = "failed" if self.error else "computing"
+		return {"status": state, "elapsed": round(time.time() - self.started, 3) if self.started else 0.0,
+			"stages": [stage.status() for stage in self.stages], "error": self.error}
+
+	def statusView(self):
+		return jsonify(self.status())
+
+	def required(self, view): #Decorator for routes that need the parsed data, goes above @chartCache.cached so a 202 is never cached
+		@functools.wraps(view)
+		def wrapper(*args, **kwargs):
+			if self.thread is not None and not self.ready.is_set(): #Nothing started means the data was parsed up front
+				response = jsonify(self.status())
+				response.status_code = 500 if self.error else 202
+				return response
+			return view(*args, **kwargs)
+		return wrapper
@@ -0,0 +1,225 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import block_reader
+import synthetic_blocks
+
+############################################################################################################
+################################################ BENCHMARKS ################################################
+#Each benchmark runs in a fresh spawned process inside the work directory, so peak RSS is its own and
+#nothing is shared through imports or caches. A benchmark returns the bytes it read; blocks come from the
+#generated chain. The modules a benchmark needs are imported before its clock starts (importing
+#transaction_size_parser alone loads Bokeh and Flask and takes longer than the parse it is timed for).
+
+def blockFiles():
+	return sorted(name for name in os.listdir(".") if name.startswith("blk") and name.endswith(".dat"))
+
+def dataBytes(paths):
+	return sum(os.path.getsize(path) for path in paths)
+
+def walkBlocks(f, callback): #Streams a blk file the way the original modules do, callback(stream) at each header
+	while True:
+		prefix = f.read(8)
+		if len(prefix) < 8:
+			return
+		magic_no, blocksize = block_reader.BLOCK_PREFIX.unpack(prefix)
+		if magic_no != block_reader.MAGIC_NO:
+			return
+		start = f.tell()
+		callback(f)
+		f.seek(start + blocksize)
+
+def benchHeaderParse(): #BlockHeader.parse over every block, one stream.read per field
+	from transaction_size_parser import BlockHeader
+
+	def parse(f):
+		BlockHeader().parse(f)
+
+	for path in blockFiles():
+		with open(path, 'rb') as f:
+			walkBlocks(f, parse)
+	return dataBytes(blockFiles())
+
+def benchTransactionsParse(): #BlockHeader.parse plus transactions.parse for every transaction (legacy serialization only)
+	from transaction_counter import BlockHeader, transactions, read_varint
+
+	def parse(f):
+		BlockHeader().parse(f)
+		for i in range(read_varint(f)):
+			transactions().parse(f)
+
+	for path in blockFiles():
+		with open(path, 'rb') as f:
+			walkBlocks(f, parse)
+	return dataBytes(blockFiles())
+
+def benchSizeParserWalk(): #transaction_size_parser's file walk from a cold start: header scan, chain, prefix sums, difficulty
+	import transaction_size_parser
+	transaction_size_parser.parseBlockFile(blockFiles()[0])
+	return dataBytes(blockFiles())
+
+def benchHeaderTable():
+	import header_table
+	header_table.HeaderTable().build(blockFiles())
+	return dataBytes(blockFiles())
+
+def benchTxDecoder(): #Every transaction and output of the best chain through tx_decoder
+	import tx_decoder
+	for tx in tx_decoder.iterTransactions(blockFiles()):
+		for output in tx.outputs():
+			pass
+	return dataBytes(blockFiles())
+
+def benchScanEngine():
+	import scan_engine
+	scan_engine.defaultEngine().run(blockFiles())
+	return dataBytes(blockFiles())
+
+def benchTextValues(): #transactions0.txt through columnar_store's text fallback
+	import columnar_store
+	columnar_store.loadTransactionValues(blockFiles()[0], datasetDir = "no-dataset")
+	return os.path.getsize(columnar_store.TRANSACTIONS_FILE)
+
+def benchTextExport(): #Both text files converted to the columnar dataset
+	import columnar_store
+	columnar_store.exportTextFiles("bench-dataset")
+	return os.path.getsize(columnar_store.TRANSACTIONS_FILE) + os.path.getsize(columnar_store.PUBKEY_FILE)
+
+BENCHMARKS = ( #(name, function, needs legacy serialization so skipped with SegWit data, modules imported untimed)
+	("BlockHeader.parse", benchHeaderParse, False, ("transaction_size_parser",)),
+	("transactions.parse", benchTransactionsParse, True, ("transaction_counter",)),
+	("size_parser.walk", benchSizeParserWalk, False, ("transaction_size_parser",)),
+	("header_table.build", benchHeaderTable, False, ("header_table",)),
+	("tx_decoder.iterTransactions", benchTxDecoder, False, ("tx_decoder",)),
+	("scan_engine.run", benchScanEngine, False, ("scan_engine",)),
+	("text.loadTransactionValues", benchTextValues, False, ("columnar_store",)),
+	("text.exportTextFiles", benchTextExport, False, ("columnar_store",)),
+)
+
+def runInChild(workDir, name): #Runs in the spawned process, returns (seconds, cpu seconds, bytes, peak RSS in KB)
+	os.chdir(workDir)
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	for path in ("chain", "headers", "prefix", "difficulty"): #Cold start for every benchmark
+		if os.path.isdir(path):
+			for entry in os.listdir(path):
+				os.remove(os.path.join(path, entry))
+	for entry in os.listdir("."): #Block index sidecars would let the header scan skip hashing
+		if entry.endswith(".idx"):
+			os.remove(entry)
+	function, modules = dict((bench[0], (bench[1], bench[3])) for bench in BENCHMARKS)[name]
+	for module in modules: #Warm imports, the function's own import statements are then dictionary lookups
+		importlib.import_module(module)
+	start = time.perf_counter()
+	cpuStart = time.process_time()
+	nbytes = function()
+	return time.perf_counter() - start, time.process_time() - cpuStart, nbytes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+############################################################################################################
+################################################ SUITE #####################################################
+
+def gitCommit():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)),
+			stderr = subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def prepare(workDir, config): #Generates the blk files and the matching text files, returns the generation summary
+	start = time.perf_counter()
+	if os.path.isdir(workDir): #Files left from a longer earlier chain would be scanned too
+		for name in os.listdir(workDir):
+			if name.startswith("blk") and name.endswith(".dat"):
+				os.remove(os.path.join(workDir, name))
+	paths = synthetic_blocks.writeBlockFiles(workDir, config)
+	cwd = os.getcwd()
+	os.chdir(workDir)
+	try:
+		synthetic_blocks.writeTextFiles([os.path.basename(path) for path in paths], ".")
+	finally:
+		os.chdir(cwd)
+	return {"files": len(paths), "bytes": dataBytes(paths), "seconds": round(time.perf_counter() - start, 3)}
+
+def runSuite(workDir, config, names = None, repeat = 1):
+	config = dict(synthetic_blocks.DEFAULT_CONFIG, **config)
+	report = {"commit": gitCommit(), "python": platform.python_version(), "platform": platform.platform(),
+		"config": config, "data": prepare(workDir, config), "results": []}
+	context = multiprocessing.get_context("spawn")
+	for name, function, legacyOnly, modules in BENCHMARKS:
+		if names and name not in names:
+			continue
+		if legacyOnly and config["segwit"] > 0:
+			report["results"].append({"name": name, "skipped": "needs data without SegWit"})
+			continue
+		runs = []
+		for i in range(repeat):
+			with context.Pool(1) as pool:
+				runs.append(pool.apply(runInChild, (os.path.abspath(workDir), name)))
+		seconds, cpuSeconds, nbytes, peakRss = min(runs) #Best of the repeats
+		report["results"].append({"name": name, "seconds": round(seconds, 4), "cpuSeconds": round(cpuSeconds, 4),
+			"blocksPerSec": round(config["blocks"] / seconds, 1), "mbPerSec": round(nbytes / seconds / 1e6, 2),
+			"bytes": nbytes, "peakRssKb": peakRss})
+	return report
+
+def compare(report, baseline): #Lines of "name  old -> new  ratio" on seconds, ratio > 1 means slower
+	old = dict((result["name"], result) for result in baseline["results"] if "seconds" in result)
+	lines = []
+	for result in report["results"]:
+		if "seconds" not in result or result["name"] not in old:
+			continue
+		ratio = result["seconds"] / max(old[result["name"]]["seconds"], 1e-9)
+		lines.append("%-28s %9.4fs -> %9.4fs  x%.2f%s" % (result["name"], old[result["name"]]["seconds"], result["seconds"], ratio,
+			"  SLOWER" if ratio > 1.1 else ""))
+	return "\n".join(lines)
+
+############################################################################################################
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Parser throughput on generated blk files")
+	parser.add_argument("benchmarks", nargs = "*", help = "benchmarks to run (default: all)")
+	parser.add_argument("-d", "--workdir", default = "bench", help = "where the synthetic chain is written")
+	parser.add_argument("-n", "--blocks", type = int, default = synthetic_blocks.DEFAULT_CONFIG["blocks"])
+	parser.add_argument("--tx", type = int, nargs = 2, metavar = ("MIN", "MAX"), default = synthetic_blocks.DEFAULT_CONFIG["txPerBlock"], help = "transactions per block")
+	parser.add_argument("--inputs", type = int, nargs = 2, metavar = ("MIN", "MAX"), default = synthetic_blocks.DEFAULT_CONFIG["inputs"])
+	parser.add_argument("--outputs", type = int, nargs = 2, metavar = ("MIN", "MAX"), default = synthetic_blocks.DEFAULT_CONFIG["outputs"])
+	parser.add_argument("--script-size", type = int, nargs = 2, metavar = ("MIN", "MAX"), default = synthetic_blocks.DEFAULT_CONFIG["scriptSize"])
+	parser.add_argument("--segwit", type = float, default = 0.0, help = "share of transactions with witness data")
+	parser.add_argument("--padding", type = int, default = 0, help = "zero bytes after each file's last block")
+	parser.add_argument("--seed", type = int, default = 1)
+	parser.add_argument("-r", "--repeat", type = int, default = 1, help = "runs per benchmark, the fastest is kept")
+	parser.add_argument("-o", "--output", help = "write the JSON report here instead of stdout")
+	parser.add_argument("--compare", help = "earlier JSON report to compare against")
+	parser.add_argument("--list", action = "store_true", help = "list the benchmarks and exit")
+	args = parser.parse_args(argv)
+
+	if args.list:
+		print("\n".join(bench[0] for bench in BENCHMARKS))
+		return 0
+
+	unknown = [name for name in args.benchmarks if name not in [bench[0] for bench in BENCHMARKS]]
+	if unknown:
+		parser.error("unknown benchmark(s): %s" % ", ".join(unknown))
+
+	config = {"blocks": args.blocks, "txPerBlock": tuple(args.tx), "inputs": tuple(args.inputs), "outputs": tuple(args.outputs),
+		"scriptSize": tuple(args.script_size), "segwit": args.segwit, "padding": args.padding, "seed": args.seed}
+	report = runSuite(args.workdir, config, args.benchmarks, args.repeat)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent = 1)
+	else:
+		print(json.dumps(report, indent = 1))
+	if args.compare:
+		with open(args.compare, 'r') as f:
+			print(compare(report, json.load(f)), file = sys.stderr)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
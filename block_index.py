@@ -0,0 +1,96 @@
+import glob
+import hashlib
+import os
+import re
+import struct
+from array import array
+
+import atomic_files
+import block_reader
+
+############################################################################################################
+################################################ SIDECAR LAYOUT ############################################
+#One sidecar per blk file ("blk00000.dat.idx"): a fixed header followed by one column per field,
+#each column a fixed-width array so it loads straight back into array.array
+
+INDEX_MAGIC = b'BIDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIIQI') #magic, version, file number, indexed file size, block count
+HASH_SIZE = 32
+
+def sidecarPath(blockfile):
+	return blockfile + ".idx"
+
+def blockFileNumber(blockfile): #blk00042.dat --> 42
+	match = re.search(r'(\d+)\.dat$', os.path.basename(blockfile))
+	if match is None:
+		return 0
+	return int(match.group(1))
+
+def discoverBlockFiles(dataDir): #Every blk*.dat in the directory in file number order
+	return sorted(glob.glob(os.path.join(dataDir, "blk*.dat")), key = blockFileNumber)
+
+############################################################################################################
+############################################### FILE INDEX #################################################
+
+class BlockFileIndex(object): #Offsets, sizes, hashes and tx counts of every block in one blk file
+
+	def __init__(self, fileNumber = 0):
+		self.fileNumber = fileNumber
+		self.fileSize = 0
+		self.offsets = array('Q')
+		self.sizes = array('I')
+		self.txCounts = array('I')
+		self.hashes = bytearray()
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def blockHash(self, i):
+		return bytes(self.hashes[i * HASH_SIZE:(i + 1) * HASH_SIZE])
+
+	def save(self, path):
+		def write(f):
+			f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.fileNumber, self.fileSize, len(self)))
+			self.offsets.tofile(f)
+			self.sizes.tofile(f)
+			self.txCounts.tofile(f)
+			f.write(self.hashes)
+		atomic_files.replaceFile(path, write)
+
+	def load(self, path):
+		with open(path, 'rb') as f:
+			magic, version, self.fileNumber, self.fileSize, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+			if magic != INDEX_MAGIC or version != INDEX_VERSION:
+				raise ValueError("%s is not a block index sidecar" % path)
+			self.offsets = array('Q')
+			self.offsets.fromfile(f, count)
+			self.sizes = array('I')
+			self.sizes.fromfile(f, count)
+			self.txCounts = array('I')
+			self.txCounts.fromfile(f, count)
+			self.hashes = bytearray(f.read(count * HASH_SIZE))
+		return self
+
+def holdsHash(blockfile, offset, blockHash): #Whether the block at offset still has that hash (display byte order)
+	try:
+		with open(blockfile, 'rb') as f:
+			f.seek(offset + block_reader.BLOCK_PREFIX.size)
+			header = f.read(block_reader.HEADER_SIZE)
+	except OSError:
+		return False
+	return len(header) == block_reader.HEADER_SIZE and hashlib.sha256(hashlib.sha256(header).digest()).digest()[::-1] == blockHash
+
+def loadSidecar(blockfile): #The saved sidecar while it still describes the start of the blk file, else None
+	path = sidecarPath(blockfile)
+	if not os.path.exists(path):
+		return None
+	try:
+		index = BlockFileIndex().load(path)
+	except (ValueError, EOFError, struct.error): #Other format or cut short
+		return None
+	if index.fileSize > os.path.getsize(blockfile): #blk files only grow, a smaller one was replaced
+		return None
+	if len(index) and not holdsHash(blockfile, index.offsets[-1], index.blockHash(len(index) - 1)): #Replaced by another file of at least the same size
+		return None
+	return index
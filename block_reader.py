@@ -0,0 +1,108 @@
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+import instrumentation
+
+############################################################################################################
+################################################ STRUCT LAYOUTS ############################################
+#Precompiled layouts so each field is decoded straight out of the mapped file with unpack_from
+
+MAGIC_NO = 0xd9b4bef9 #Mainnet network magic at the start of every block
+HEADER_SIZE = 80
+
+BLOCK_PREFIX = struct.Struct('<II') #magic_no, blocksize
+BLOCK_HEADER = struct.Struct('<I32s32sIII') #version, previousHash, merkleHash, time, bits, nonce
+UINT16 = struct.Struct('<H')
+UINT32 = struct.Struct('<I')
+UINT64 = struct.Struct('<Q')
+
+HeaderFields = namedtuple("HeaderFields", ["version", "previousHash", "merkleHash", "time", "bits", "nonce"])
+BlockRecord = namedtuple("BlockRecord", ["offset", "magic_no", "blocksize", "blockheader", "transaction_count"])
+
+############################################################################################################
+################################################ BUFFER FUNCTIONS ##########################################
+
+def read_varint_at(buf, offset): #Returns (value, offset of the next field)
+	ret = buf[offset]
+
+	if ret < 0xfd: #One byte integer
+		return ret, offset + 1
+	if ret == 0xfd: #Next two bytes
+		return UINT16.unpack_from(buf, offset + 1)[0], offset + 3
+	if ret == 0xfe: #Next four bytes
+		return UINT32.unpack_from(buf, offset + 1)[0], offset + 5
+	return UINT64.unpack_from(buf, offset + 1)[0], offset + 9 #Next eight bytes
+
+def read_header_at(buf, offset): #Decodes the 80 byte header the same way BlockHeader.parse does
+	version, previousHash, merkleHash, time, bits, nonce = BLOCK_HEADER.unpack_from(buf, offset)
+	return HeaderFields(version, previousHash[::-1], merkleHash[::-1], time, bits, nonce)
+
+def read_block_at(buf, offset): #Decodes the block starting at offset, None if there is no complete block there
+	if offset + BLOCK_PREFIX.size > len(buf):
+		return None
+
+	magic_no, blocksize = BLOCK_PREFIX.unpack_from(buf, offset)
+	if magic_no != MAGIC_NO: #Zero padding at the end of a preallocated file
+		return None
+	if offset + BLOCK_PREFIX.size + blocksize > len(buf): #Block still being written
+		return None
+
+	headerOffset = offset + BLOCK_PREFIX.size
+	blockheader = read_header_at(buf, headerOffset)
+	transaction_count = read_varint_at(buf, headerOffset + HEADER_SIZE)[0]
+	return BlockRecord(offset, magic_no, blocksize, blockheader, transaction_count)
+
+def dataEnd(blockfile, offset = 0): #Offset just past the last complete block from offset on, reading one prefix per block
+	#Bitcoin Core preallocates blk files with zeros, so the file size says nothing about how many blocks are in one
+	fileSize = os.path.getsize(blockfile)
+	if offset > fileSize: #Replaced by a smaller file
+		offset = 0
+	with open(blockfile, 'rb') as f:
+		while offset + BLOCK_PREFIX.size <= fileSize:
+			f.seek(offset)
+			magic_no, blocksize = BLOCK_PREFIX.unpack(f.read(BLOCK_PREFIX.size))
+			if magic_no != MAGIC_NO or offset + BLOCK_PREFIX.size + blocksize > fileSize:
+				break
+			offset += BLOCK_PREFIX.size + blocksize
+	return offset
+
+############################################################################################################
+############################################### BLOCK FILE #################################################
+
+class BlockFile(object): #Memory maps a blk*.dat file once and walks it block by block
+
+	def __init__(self, blockfile):
+		self.blockfile = blockfile
+		self.fileSize = os.path.getsize(blockfile)
+		self.mapped = None
+		self.buffer = memoryview(b"")
+
+		instrumentation.count("files_mapped")
+		instrumentation.count("bytes_mapped", self.fileSize)
+		if self.fileSize > 0: #mmap refuses empty files
+			with open(blockfile, 'rb') as bf:
+				self.mapped = mmap.mmap(bf.fileno(), 0, access = mmap.ACCESS_READ)
+			self.buffer = memoryview(self.mapped)
+
+	def iterBlocks(self, offset = 0): #Yields a BlockRecord per block, jumping blocksize + 8 bytes each time
+		buf = self.buffer
+		while True:
+			record = read_block_at(buf, offset)
+			if record is None:
+				return
+			yield record
+			offset += record.blocksize + BLOCK_PREFIX.size
+
+	def close(self):
+		self.buffer.release()
+		if self.mapped is not None:
+			self.mapped.close()
+			self.mapped = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
@@ -7,24 +7,29 @@ from bokeh.models.glyphs import VBar
 from bokeh.plotting import figure
 from bokeh.embed import components
 from bokeh.models.sources import ColumnDataSource
-from flask import Flask, render_template
+from flask import Flask, render_template, abort, jsonify
+import chart_cache
+import chain_index
+import ingest
+import rewards
+import background_jobs
+import instrumentation
 
 ############################################################################################################
 ################################################ PYTHON FUNCTIONS ##########################################
-data = {"Block": [], "Transactions": []} #Dict used to hold graph data
-
-#As rewards change consistantly data can be hardcoded
-data["Block"].append(1)
-data["Block"].append(2)
-data["Block"].append(3)
-data["Transactions"].append(50)
-data["Transactions"].append(25)
-data["Transactions"].append(12.5)
+data = {"Block": [], "Subsidy": [], "Fees": [], "Reward": []} #Dict used to hold graph data, one entry per halving epoch
+rewardSeries = chart_cache.ReloadedData(rewards.RewardSeries, [os.path.join(rewards.REWARDS_DIR, name + ".npy") for name in ("coinbase", "blockKeys")]) #Coinbase total of every height, read again once rewards.py extends it
 
+@instrumentation.timed("block_rewards.parseBlockFile")
 def parseBlockFile(blockfile):
 	block = Block()
 	block.parseBlockFile(blockfile)
 
+def loadScanResults(results): #Same chart data from a scan_engine pass instead of parsing again
+	series = rewardSeries.get()
+	series.columns["coinbase"] = results["rewards"] #Kept until the saved series changes
+	data.update(series.chartData())
+
 def read_1bit(stream):
 	return ord(stream.read(1))
 
@@ -58,7 +63,7 @@ def read_varint(stream):
 	return -1
 
 def get_hexstring(bytebuffer):
-	return(''.join(('%x' %i for i in bytebuffer)))
+	return(''.join(('%02x' %i for i in bytebuffer)))
 
 ############################################################################################################
 ################################################ BOOKEH FUNCTIONS ##########################################
@@ -68,14 +73,15 @@ def create_hover_tool(): #Hover tool for barchart
 			<span class = "hover_tooltip">Block Range: $x</span>
 		</div>
 		<div>
-			<span class = "hover_tooltip">Reward: @Transactions BTC</span>
+			<span class = "hover_tooltip">Reward: @Reward BTC (@Subsidy subsidy + @Fees fees)</span>
 		</div>
 	"""
 	return HoverTool(tooltips = hover_html)
 
+@instrumentation.timed("bokeh.create_bar_chart")
 def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 1200, height = 300):
 	source = ColumnDataSource(data)
-	xdr = FactorRange("0 - 209,999", "210,000 - 419,999", "420,000 - 629,999")
+	xdr = FactorRange(factors = data[x_name])
 	ydr = Range1d(start = 0, end = max(data[y_name])*1.2)
 
 	tools = []
@@ -87,7 +93,9 @@ def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 120
                   min_border=0, toolbar_location="above", tools=tools,
                   responsive=True, outline_line_color="#666666")
 
-	glyph = VBar(x = x_name, top = y_name, bottom = 0, width = 0.8, fill_color = "#e12127")
+	glyph = VBar(x = x_name, top = "Subsidy", bottom = 0, width = 0.8, fill_color = "#e12127")
+	plot.add_glyph(source, glyph)
+	glyph = VBar(x = x_name, top = y_name, bottom = "Subsidy", width = 0.8, fill_color = "#f4a582") #Fees stacked on the subsidy
 	plot.add_glyph(source, glyph)
 
 	xaxis = LinearAxis()
@@ -105,24 +113,49 @@ def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 120
 	plot.xaxis.major_label_orientation = 1
 	return plot
 
+@instrumentation.timed("block_rewards.create_chart")
+def create_chart(window_size = rewards.HALVING_INTERVAL, blocks_count = None): #Builds the plot without needing a request, used by the route and build_charts
+	chartData = rewardSeries.get().chartData(window_size, blocks_count) #Not data, the saved series may have been extended since
+	hover = create_hover_tool()
+	return create_bar_chart(chartData, "Reward of mining a block within a block range", "Block", "Reward", hover)
+
 app = Flask(__name__)
+chartCache = chart_cache.ChartCache(ingest.discoverBlockFiles() + rewardSeries.dataFiles) #Rendered charts per route and parameters
+precompute = background_jobs.BackgroundJob(app) #Parsing runs after the server is up, GET /status shows how far it got
+instrumentation.register(app, chartCache) #GET /metrics in Prometheus text format
 
-@app.route("/<int:blocks_count>/")
+@app.route("/<int:blocks_count>/", defaults = {"window_size": rewards.HALVING_INTERVAL})
+@app.route("/<int:blocks_count>/<int:window_size>/")
+@precompute.required
+@chartCache.cached
 
-def chart(blocks_count):
+def chart(blocks_count, window_size): #One bar per halving epoch unless a window size is given
 	if blocks_count <= 0:
 		blocks_count = 1
+	if window_size <= 0:
+		abort(400)
+	if len(rewardSeries.get()) == 0:
+		abort(404)
 
-	hover = create_hover_tool()
-	plot = create_bar_chart(data, "Reward of mining a block within a block range", "Block", "Transactions", hover)
+	plot = create_chart(window_size, blocks_count) #Only the first blocks_count heights are charted
 
-	script, div = components(plot)
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
 
 	return render_template("chart_05.html", blocks_count = blocks_count, the_div = div, the_script = script)
 
+@app.route("/subsidy/<int:start>/<int:end>/")
+
+def subsidy_range(start, end): #New coins the blocks between two heights (inclusive) may claim, from the halving schedule alone
+	if start > end or end > rewards.MAX_HEIGHT:
+		abort(404)
+
+	total = rewards.subsidyTotal(start, end)
+	return jsonify({"start": start, "end": end, "blocks": end - start + 1, "subsidy": total, "btc": total / float(rewards.COIN)})
+
 ############################################################################################################
 ############################################### BLOCK READER ###############################################
-class Block(object): #No data needs to be parsed so class is unused
+class Block(object):
 
 	def __init__(self):
 		self.magic_no = -1
@@ -134,6 +167,10 @@ class Block(object): #No data needs to be parsed so class is unused
 
 	def parseBlockFile(self, blockfile):
 
+		blockfiles = ingest.discoverBlockFiles(os.path.dirname(blockfile) or ".", blockfile) #Every blockfile from the first one on
+		series = rewardSeries.get()
+		series.update(blockfiles) #Only heights added since the last run have their coinbase decoded
+		data.update(series.chartData()) #Per halving epoch, as many as the chain covers
 		return data
 			
 ############################################################################################################
@@ -249,9 +286,11 @@ class transactions(object): #No data needs to be parsed so class is unused
 if __name__ == "__main__":
 
 	import sys
-	usage = "Usage: pyhton {0} "
+	usage = "Usage: pyhton {0} [workers]"
 	if len(sys.argv) < 1:
 		print(usage.format(sys.argv[0]))
 	else: 
-		parseBlockFile("blk00000.dat") #Initial file to be parsed
+		workers = int(sys.argv[1]) if len(sys.argv) > 1 else None #Number of processes for the parallel header scan
+		precompute.start([("chain", lambda: chain_index.loadChain(ingest.discoverBlockFiles(), workers = workers)), #Header scan and chain order
+			("rewards", lambda: parseBlockFile("blk00000.dat"))], reloader = True) #Initial file to be parsed, in the reloader's serving process
 	app.run(debug = True)
\ No newline at end of file
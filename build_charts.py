@@ -0,0 +1,83 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+############################################################################################################
+################################################ CHARTS ####################################################
+#Every chart module is only imported when it is built, so listing charts or printing help needs neither
+#Bokeh nor Flask
+
+CHARTS = ("transaction_size_parser", "transaction_counter", "transaction_value_ranges", "valuable_transactions", "block_rewards")
+OUTPUT_DIR = "charts"
+
+def buildChart(name, blockfile, outputDir, workers = None, results = None): #Parses once, writes <name>.json (json_item) and <name>.html (components)
+	from bokeh.embed import components, json_item
+
+	module = importlib.import_module(name)
+	if results is not None: #Already scanned for every chart
+		module.loadScanResults(results)
+	elif name == "transaction_size_parser":
+		module.parseBlockFile(blockfile, workers)
+	else:
+		module.parseBlockFile(blockfile)
+	plot = module.create_chart()
+
+	with open(os.path.join(outputDir, name + ".json"), 'w') as f:
+		json.dump(json_item(plot, name), f)
+
+	script, div = components(plot)
+	with open(os.path.join(outputDir, name + ".html"), 'w') as f:
+		f.write(script + "\n" + div + "\n")
+
+def buildCharts(names, blockfile, outputDir = OUTPUT_DIR, workers = None, onePass = False):
+	if not os.path.isdir(outputDir):
+		os.makedirs(outputDir)
+
+	manifest = {"built": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "charts": {}}
+	results = None
+	if onePass: #One decode of the blk files feeds every chart, straight from blocks rather than stored text files
+		import ingest
+		import scan_engine
+		engine = scan_engine.defaultEngine()
+		results = engine.run(ingest.discoverBlockFiles(os.path.dirname(blockfile) or ".", blockfile))
+		manifest["scan"] = {"plugins": dict((name, round(seconds, 3)) for name, seconds in engine.timings.items()), "decode": round(engine.decodeSeconds, 3)}
+		print(engine.report())
+
+	for name in names:
+		start = time.time()
+		buildChart(name, blockfile, outputDir, workers, results)
+		manifest["charts"][name] = {"json": name + ".json", "html": name + ".html", "seconds": round(time.time() - start, 3)}
+		print("Built %s in %.1fs" % (name, manifest["charts"][name]["seconds"]))
+
+	with open(os.path.join(outputDir, "manifest.json"), 'w') as f:
+		json.dump(manifest, f, indent = 1)
+	return manifest
+
+############################################################################################################
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Precompute every chart to static JSON/HTML")
+	parser.add_argument("charts", nargs = "*", help = "charts to build (default: all)")
+	parser.add_argument("-o", "--output", default = OUTPUT_DIR, help = "output directory")
+	parser.add_argument("-b", "--blockfile", default = "blk00000.dat", help = "first blockfile to parse")
+	parser.add_argument("-w", "--workers", type = int, default = None, help = "processes for the parallel header scan")
+	parser.add_argument("-1", "--one-pass", action = "store_true", help = "scan the blk files once for all charts")
+	parser.add_argument("--list", action = "store_true", help = "list the charts and exit")
+	args = parser.parse_args(argv)
+
+	if args.list:
+		print("\n".join(CHARTS))
+		return 0
+
+	unknown = [name for name in args.charts if name not in CHARTS]
+	if unknown:
+		parser.error("unknown chart(s): %s" % ", ".join(unknown))
+
+	buildCharts(args.charts or CHARTS, args.blockfile, args.output, args.workers, args.one_pass)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
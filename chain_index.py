@@ -0,0 +1,304 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import atomic_files
+import block_index
+import block_reader
+import header_table
+import instrumentation
+
+############################################################################################################
+################################################ CHAIN INDEX ###############################################
+#Links every header in the header table to its parent through previousHash, picks the tip with the most work
+#and walks back from it. Rows on that path get their real height, every other row is a stale block.
+#chain/<column>.npy plus chain/meta.json naming the blk files (full paths and data ends) it was built from. The chain always
+#covers every blk file of the data directory, whichever of them a caller names.
+
+CHAIN_DIR = "chain"
+CHAIN_META = os.path.join(CHAIN_DIR, "meta.json") #Replaced last on every save, what readers of the saved chain watch
+COLUMNS = ("parent", "height", "chainWork", "mainChain", "mainRows")
+PROGRESS_EVERY = 1000 #Blocks between progress hook calls
+MAPPED_FILES = 8 #blk files a walk keeps mapped, the current one plus neighbours holding blocks stored out of order
+
+def decodeTarget(bits): #Compact bits --> target as float64, mantissa * 256^(exponent - 3) for the whole column at once
+	bits = np.asarray(bits, dtype = np.uint32)
+	exponent = (bits >> 24).astype(np.float64)
+	mantissa = (bits & 0x007fffff).astype(np.float64)
+	return mantissa * np.power(256.0, exponent - 3)
+
+def blockWork(bits): #Expected hashes per block, 2^256 / (target + 1)
+	target = decodeTarget(bits)
+	return np.where(target > 0, 2.0 ** 256 / (target + 1), 0.0)
+
+def hashKeys(hashes): #Internal order starts with the last 8 display bytes, the leading display bytes are mostly zero
+	return np.ascontiguousarray(hashes[:, 24:32]).view('<u8').ravel()
+
+def linkParents(table): #Row of each block's parent, -1 when the parent is not in the table
+	hashes = table["hash"]
+	previous = table["previousHash"]
+	keys = hashKeys(hashes)
+	order = np.argsort(keys, kind = 'stable')
+	sortedKeys = keys[order]
+
+	parentKeys = hashKeys(previous)
+	pos = np.minimum(np.searchsorted(sortedKeys, parentKeys), max(len(order) - 1, 0))
+	parent = np.full(len(keys), -1, dtype = np.int64)
+	if len(order) == 0:
+		return parent
+	candidates = order[pos]
+	found = (sortedKeys[pos] == parentKeys) & (hashes[candidates] == previous).all(axis = 1) #Full 32 byte check behind the key match
+	parent[found] = candidates[found]
+	return parent
+
+def accumulate(parent, values): #Sum of values from each row back to its root, by pointer jumping (log2 of the longest branch passes)
+	totals = values.copy()
+	ancestor = parent.copy()
+	linked = ancestor >= 0
+	while linked.any():
+		rows = np.nonzero(linked)[0]
+		totals[rows] += totals[ancestor[rows]]
+		ancestor[rows] = ancestor[ancestor[rows]]
+		linked = ancestor >= 0
+	return totals
+
+class ChainIndex(object):
+
+	def __init__(self, table = None):
+		self.table = table
+		self.columns = {}
+		self.blockfiles = [] #Paths of the blk files the table was built from
+
+	def __len__(self): #Blocks on the best chain
+		return len(self.columns["mainRows"]) if self.columns else 0
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	@instrumentation.timed("chain_build")
+	def build(self, table):
+		self.table = table
+		parent = linkParents(table)
+		height = accumulate(parent, (parent >= 0).astype(np.int64)) #Roots are height 0
+		chainWork = accumulate(parent, blockWork(table["bits"]))
+
+		mainChain = np.zeros(len(parent), dtype = bool)
+		mainRows = np.zeros(0, dtype = np.int64)
+		if len(parent):
+			row = int(np.argmax(chainWork))
+			mainRows = np.empty(height[row] + 1, dtype = np.int64)
+			while row >= 0:
+				mainRows[height[row]] = row
+				row = parent[row]
+			mainChain[mainRows] = True
+
+		self.columns = {"parent": parent, "height": height.astype(np.int32), "chainWork": chainWork,
+			"mainChain": mainChain, "mainRows": mainRows}
+		return self
+
+	def tip(self): #Header table row of the best block
+		return int(self.columns["mainRows"][-1])
+
+	def staleRows(self):
+		return np.nonzero(~self.columns["mainChain"])[0]
+
+	def heightOf(self, rows): #Real height of header table rows, -1 for stale blocks
+		rows = np.asarray(rows)
+		return np.where(self.columns["mainChain"][rows], self.columns["height"][rows], -1)
+
+	def mainColumn(self, name): #Any header table column in height order, stale blocks left out
+		return self.table[name][self.columns["mainRows"]]
+
+	def blockfile(self, row): #blk file holding a header table row
+		fileNumber = int(self.table["fileNumber"][row])
+		for blockfile in self.blockfiles:
+			if block_index.blockFileNumber(blockfile) == fileNumber:
+				return blockfile
+		raise KeyError("no blk file %d in the chain's files" % fileNumber)
+
+	def get_block(self, height): #Seeks straight to the block at a best chain height and decodes it, negative heights count from the tip
+		if height < 0:
+			height += len(self)
+		if not 0 <= height < len(self):
+			raise IndexError("height %d out of range" % height)
+		row = int(self.columns["mainRows"][height])
+		offset = int(self.table["offset"][row])
+		with open(self.blockfile(row), 'rb') as bf:
+			bf.seek(offset)
+			raw = bf.read(int(self.table["blocksize"][row]) + block_reader.BLOCK_PREFIX.size)
+		return block_reader.read_block_at(raw, 0)._replace(offset = offset)
+
+	def iter_blocks(self, start = 0, stop = None): #Yields the BlockRecords of heights start..stop-1, only those blocks are read
+		for buf, record in self.iter_mapped_blocks(start, stop):
+			yield record
+
+	def iter_mapped_blocks(self, start = 0, stop = None): #Same walk yielding (mapped buffer, BlockRecord) so transactions can be decoded in place
+		for blockfile, buf, record, height in iterChainBlocks(self.blockfiles, self, start, stop):
+			yield buf, record
+
+	def blockKeys(self, start = 0, stop = None): #hashKeys of the best chain from height start to stop, saved by the per-height stores
+		return hashKeys(self.table["hash"][self.columns["mainRows"][start:stop]])
+
+	def keptHeights(self, keys, stored): #How many of a store's leading heights are still on the best chain, keys being the block keys saved with them
+		#A block hash covers every block before it, so a matching last key means every earlier height matches too.
+		#Stores saved before they kept keys (None) are taken to match as far as the chain goes
+		n = min(stored, len(self))
+		if keys is not None:
+			n = min(n, len(keys))
+			if n and keys[n - 1] != self.blockKeys(n - 1, n)[0]:
+				n = int(np.argmin(np.asarray(keys[:n]) == self.blockKeys(0, n))) #Fork point of the reorg
+		return n
+
+	def save(self, chainDir = CHAIN_DIR, sources = None):
+		if not os.path.isdir(chainDir):
+			os.makedirs(chainDir)
+		for name in COLUMNS:
+			atomic_files.saveArray(os.path.join(chainDir, name + ".npy"), self.columns[name])
+		meta = {"sources": sources or [], "blocks": len(self), "stale": len(self.staleRows())}
+		atomic_files.saveJson(os.path.join(chainDir, "meta.json"), meta) #Written last, so the columns are complete once it names the new files
+
+	def load(self, chainDir = CHAIN_DIR, headerDir = header_table.HEADER_DIR):
+		self.table = header_table.HeaderTable().load(headerDir)
+		self.columns = dict((name, np.load(os.path.join(chainDir, name + ".npy"), mmap_mode = 'r')) for name in COLUMNS)
+		return self
+
+def dataFiles(blockfiles): #Every blk file next to the given ones (plus the given ones), so every caller indexes the same set
+	if not blockfiles:
+		return []
+	found = [os.path.normpath(blockfile) for blockfile in block_index.discoverBlockFiles(os.path.dirname(blockfiles[0]) or ".")]
+	found += [os.path.normpath(blockfile) for blockfile in blockfiles if os.path.normpath(blockfile) not in found]
+	return sorted(found, key = block_index.blockFileNumber)
+
+def loadChain(blockfiles, chainDir = CHAIN_DIR, headerDir = header_table.HEADER_DIR, workers = None): #Reuses the saved chain while the blk files are unchanged
+	#otherwise extends the saved header table with the files that have new blocks (in workers processes) and links the chain again
+	blockfiles = dataFiles(blockfiles)
+	metaPath = os.path.join(chainDir, "meta.json")
+	chain = None
+	previous = None
+	previousSources = []
+	saved = os.path.exists(metaPath) and os.path.exists(os.path.join(headerDir, "time.npy"))
+	if saved:
+		with open(metaPath, 'r') as f:
+			previousSources = [(path, end) for path, end in json.load(f).get("sources", [])] #Older chains saved file names, they are rebuilt
+		previous = header_table.HeaderTable().load(headerDir)
+		previousSources = header_table.unchangedSources(previous, previousSources) #Files replaced since are scanned again from the start
+	sources = header_table.fileSources(blockfiles, previousSources)
+	if saved and previousSources == sources:
+		chain = ChainIndex().load(chainDir, headerDir)
+
+	if chain is None:
+		table = header_table.HeaderTable().build(blockfiles, previous, previousSources, workers, sources)
+		table.save(headerDir)
+		chain = ChainIndex().build(table)
+		chain.save(chainDir, sources)
+	chain.blockfiles = blockfiles
+	return chain
+
+def loadSavedChain(chainDir = CHAIN_DIR, headerDir = header_table.HEADER_DIR): #The chain as precompute or an Ingestor last saved it, None before the first save
+	#Nothing is scanned or written, so request threads can load it while a rebuild runs elsewhere
+	metaPath = os.path.join(chainDir, "meta.json")
+	if not os.path.exists(metaPath):
+		return None
+	with open(metaPath, 'r') as f:
+		sources = json.load(f).get("sources", [])
+	chain = ChainIndex().load(chainDir, headerDir)
+	chain.blockfiles = sorted((os.path.normpath(path) for path, end in sources), key = block_index.blockFileNumber)
+	return chain
+
+def iterChainBlocks(blockfiles, chain = None, start = 0, stop = None): #Yields (blockfile, mapped buffer, BlockRecord, height) for the best chain from height start to stop - 1
+	#Only the last MAPPED_FILES files stay mapped (each map holds a file descriptor), so a buffer or record is
+	#valid until the walk has moved that many files on
+	if chain is None:
+		chain = loadChain(blockfiles)
+	byNumber = dict((block_index.blockFileNumber(blockfile), blockfile) for blockfile in chain.blockfiles or blockfiles)
+	fileNumbers = chain.table["fileNumber"]
+	offsets = chain.table["offset"]
+	mainRows = chain["mainRows"][:stop]
+
+	mapped = OrderedDict() #File number --> BlockFile, least recently used first
+	try:
+		total = max(len(mainRows) - start, 0)
+		for height in range(start, len(mainRows)):
+			if instrumentation.progressHooks and (height - start) % PROGRESS_EVERY == 0:
+				instrumentation.progress(height - start, total)
+			row = mainRows[height]
+			fileNumber = int(fileNumbers[row])
+			bf = mapped.get(fileNumber)
+			if bf is None:
+				if len(mapped) >= MAPPED_FILES:
+					mapped.popitem(last = False)[1].close()
+				bf = mapped[fileNumber] = block_reader.BlockFile(byNumber[fileNumber])
+			else:
+				mapped.move_to_end(fileNumber)
+			yield byNumber[fileNumber], bf.buffer, block_reader.read_block_at(bf.buffer, int(offsets[row])), height
+		instrumentation.progress(total, total)
+		if instrumentation.ENABLED: #Totals from the header table, nothing added per block
+			instrumentation.count("blocks_walked", total)
+			instrumentation.count("bytes_walked", int(chain.table["blocksize"][mainRows[start:]].sum()))
+	finally:
+		for bf in mapped.values():
+			bf.close()
+
+############################################################################################################
+################################################ HEIGHT STORES #############################################
+#Per-height columns of the best chain saved as <dir>/<name>.npy, with blockKeys.npy holding the block key of each
+#height. Columns named in totals hold running totals with one extra entry in front (entry n is the total of heights
+#0..n-1). An update cuts every column back to the heights still on the best chain and appends the rest.
+
+class HeightStore(object):
+
+	def __init__(self, storeDir, dtypes, totals = ()): #dtypes is (name, dtype) per column in the order they are saved
+		self.storeDir = storeDir
+		self.totals = tuple(totals)
+		self.columns = dict((name, np.zeros(1 if name in self.totals else 0, dtype = dtype)) for name, dtype in dtypes)
+		self.keys = np.zeros(0, dtype = np.uint64) #Block key of each height, None for stores saved before they were kept
+
+		if all(os.path.exists(self.path(name)) for name in self.columns):
+			for name in self.columns:
+				self.columns[name] = np.load(self.path(name), mmap_mode = 'r')
+			self.keys = np.load(self.path("blockKeys"), mmap_mode = 'r') if os.path.exists(self.path("blockKeys")) else None
+
+	def path(self, name):
+		return os.path.join(self.storeDir, name + ".npy")
+
+	def __len__(self): #Number of heights covered
+		name = next(iter(self.columns))
+		return len(self.columns[name]) - (1 if name in self.totals else 0)
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	def keptHeights(self, chain): #Leading heights still on the best chain, the height an update starts from
+		return chain.keptHeights(self.keys, len(self))
+
+	def replace(self, chain, start, added): #Cuts every column back to height start and appends added, the values of heights start on
+		#Running totals are accumulated from per-height values. Returns how many heights were added
+		count = len(next(iter(added.values())))
+		keys = self.keys[:start] if self.keys is not None else chain.blockKeys(0, start)
+		for name in self.columns:
+			column = self.columns[name][:start + 1 if name in self.totals else start]
+			values = np.asarray(added[name], dtype = column.dtype)
+			if name in self.totals:
+				values = column[-1] + np.cumsum(values)
+			self.columns[name] = np.concatenate((column, values))
+		self.keys = np.concatenate((keys, chain.blockKeys(start, start + count)))
+
+		if not os.path.isdir(self.storeDir):
+			os.makedirs(self.storeDir)
+		for name in tuple(self.columns) + ("blockKeys",): #Keys last, they are only read along with complete columns
+			atomic_files.saveArray(self.path(name), self.keys if name == "blockKeys" else self.columns[name])
+		return count
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		chain = loadChain(sys.argv[1:])
+		print("Best chain: %d blocks, %d stale" % (len(chain), len(chain.staleRows())))
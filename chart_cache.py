@@ -0,0 +1,113 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, make_response
+
+############################################################################################################
+################################################ CHART CACHE ###############################################
+#Rendered chart pages kept per (route, parameters) with a size and age limit. Entries are tied to the
+#modification times of the data files behind the chart so they drop out once a file changes. Data the pages
+#are rendered from is held in a ReloadedData, so a changed file is also read again and not just re-rendered.
+
+CACHE_SIZE = 128
+CACHE_TTL = 600 #Seconds
+
+class ChartCache(object):
+
+	def __init__(self, dataFiles = (), maxEntries = CACHE_SIZE, ttl = CACHE_TTL):
+		self.dataFiles = list(dataFiles)
+		self.maxEntries = maxEntries
+		self.ttl = ttl
+		self.entries = OrderedDict() #key --> (version, time stored, page)
+		self.lock = threading.Lock()
+		self.startTime = time.time()
+		self.hits = 0
+		self.misses = 0
+
+	def dataVersion(self): #(mtimes of the files that exist, newest mtime)
+		mtimes = []
+		for path in self.dataFiles:
+			try:
+				mtimes.append(os.stat(path).st_mtime)
+			except OSError:
+				mtimes.append(None)
+		newest = max([m for m in mtimes if m is not None] or [self.startTime])
+		return tuple(mtimes), newest
+
+	def get(self, key, version):
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				return None
+			if entry[0] != version or time.time() - entry[1] > self.ttl:
+				del self.entries[key]
+				return None
+			self.entries.move_to_end(key)
+			return entry[2]
+
+	def put(self, key, version, page):
+		with self.lock:
+			self.entries[key] = (version, time.time(), page)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxEntries:
+				self.entries.popitem(last = False) #Least recently used
+
+	def invalidate(self):
+		with self.lock:
+			self.entries.clear()
+
+	def cached(self, view): #Decorator for chart routes, also answers repeat loads with 304
+		@functools.wraps(view)
+		def wrapper(*args, **kwargs):
+			key = (request.path, tuple(sorted(request.args.items(multi = True))))
+			version, lastModified = self.dataVersion()
+			etag = hashlib.sha1(repr((key, version)).encode('utf-8')).hexdigest()
+
+			if request.if_none_match.contains(etag) or \
+				(not request.if_none_match and request.if_modified_since is not None and request.if_modified_since.timestamp() >= int(lastModified)):
+				response = make_response("", 304)
+			else:
+				page = self.get(key, version)
+				if page is None:
+					self.misses += 1
+					page = view(*args, **kwargs)
+					self.put(key, version, page)
+				else:
+					self.hits += 1
+				response = make_response(page)
+
+			response.set_etag(etag)
+			response.last_modified = lastModified
+			return response
+		return wrapper
+
+def fileVersion(paths): #Inode and mtime of each file, files are replaced by a rename so either one changes
+	version = []
+	for path in paths:
+		try:
+			stat = os.stat(path)
+			version.append((stat.st_ino, stat.st_mtime_ns))
+		except OSError:
+			version.append(None)
+	return tuple(version)
+
+class ReloadedData(object): #Whatever load() returns, loaded again once one of the data files changed (e.g. an Ingestor in another process)
+
+	def __init__(self, load, dataFiles):
+		self.load = load
+		self.dataFiles = list(dataFiles)
+		self.lock = threading.Lock()
+		self.version = None
+		self.value = None
+
+	def get(self):
+		version = fileVersion(self.dataFiles) #Taken before loading, a file replaced meanwhile is loaded again next time
+		with self.lock:
+			if version != self.version:
+				self.value = self.load()
+				self.version = version
+			return self.value
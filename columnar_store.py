@@ -0,0 +1,184 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+import atomic_files
+import chain_index
+import instrumentation
+import tx_decoder
+import window_aggregates
+
+############################################################################################################
+################################################ DATASET LAYOUT ############################################
+#dataset/values.npy           int64 transaction value in satoshis, one row per transaction
+#dataset/heights.npy          int64 block number of each row
+#dataset/pubkeys.offsets.npy  int64 start of each pubkey in the blob, one extra entry for the end
+#dataset/pubkeys.blob         every pubkey back to back
+#dataset/meta.json            row counts and how the pubkeys are encoded
+
+DATASET_DIR = "dataset"
+TRANSACTIONS_FILE = "transactions0.txt"
+PUBKEY_FILE = "pubKey0.txt"
+PROGRESS_LINES = 1 << 16 #Lines between progress reports while reading a text file
+
+def datasetExists(datasetDir = DATASET_DIR):
+	return os.path.exists(os.path.join(datasetDir, "meta.json"))
+
+def sourceFiles(datasetDir = DATASET_DIR): #Files the loaders below depend on, blk files are read through the saved chain
+	return [os.path.join(datasetDir, "meta.json"), TRANSACTIONS_FILE, chain_index.CHAIN_META]
+
+############################################################################################################
+################################################ EXPORT ####################################################
+
+def writeDataset(datasetDir, values, heights, pubKeyBlob, pubKeyOffsets, pubKeyEncoding):
+	if not os.path.isdir(datasetDir):
+		os.makedirs(datasetDir)
+
+	for name, column in (("values", values), ("heights", heights), ("pubkeys.offsets", pubKeyOffsets)):
+		atomic_files.saveArray(os.path.join(datasetDir, name + ".npy"), np.frombuffer(column, dtype = '<i8'))
+	atomic_files.replaceFile(os.path.join(datasetDir, "pubkeys.blob"), lambda f: f.write(pubKeyBlob))
+
+	meta = {"transactions": len(values), "pubkeys": len(pubKeyOffsets) - 1, "pubKeyEncoding": pubKeyEncoding}
+	atomic_files.saveJson(os.path.join(datasetDir, "meta.json"), meta) #Written last, the columns are complete once it changes
+
+def exportTextFiles(datasetDir = DATASET_DIR, transactionsFile = TRANSACTIONS_FILE, pubKeyFile = PUBKEY_FILE): #Converts the pre-extracted text files once
+	values = array('q')
+	heights = array('q')
+	for blockNumber, value in enumerate(iterTextValues(transactionsFile)): #Line number is what the charts use as the block number
+		values.append(value)
+		heights.append(blockNumber)
+
+	pubKeyBlob = bytearray()
+	pubKeyOffsets = array('q', [0])
+	if os.path.exists(pubKeyFile):
+		with open(pubKeyFile, 'r') as p:
+			for line in p:
+				pubKeyBlob += line.strip().encode('ascii')
+				pubKeyOffsets.append(len(pubKeyBlob))
+
+	writeDataset(datasetDir, values, heights, pubKeyBlob, pubKeyOffsets, "text")
+
+def exportBlockFiles(blockfiles, datasetDir = DATASET_DIR): #Builds the same dataset straight from blk files, pubkeys kept as raw script bytes
+	values = array('q')
+	heights = array('q')
+	pubKeyBlob = bytearray()
+	pubKeyOffsets = array('q', [0])
+
+	for tx in tx_decoder.iterTransactions(blockfiles):
+		values.append(tx.value())
+		heights.append(tx.height)
+		for output in tx.outputs():
+			pubKeyBlob += output.scriptPubKey
+			pubKeyOffsets.append(len(pubKeyBlob))
+
+	writeDataset(datasetDir, values, heights, pubKeyBlob, pubKeyOffsets, "raw")
+
+############################################################################################################
+################################################ LOADING ###################################################
+
+class PubKeyColumn(object): #List-like view over the offsets + blob files, entries come back as hex strings
+
+	def __init__(self, offsets, blob, encoding):
+		self.offsets = offsets
+		self.blob = blob
+		self.encoding = encoding
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def raw(self, i):
+		return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError("pubkey index out of range")
+		if self.encoding == "raw":
+			return self.raw(i).hex()
+		return self.raw(i).decode('ascii')
+
+class Dataset(object): #Memory mapped columns, pages are shared between processes through the page cache
+
+	def __init__(self, datasetDir = DATASET_DIR):
+		with open(os.path.join(datasetDir, "meta.json"), 'r') as f:
+			self.meta = json.load(f)
+
+		self.values = np.load(os.path.join(datasetDir, "values.npy"), mmap_mode = 'r')
+		self.heights = np.load(os.path.join(datasetDir, "heights.npy"), mmap_mode = 'r')
+
+		offsets = np.load(os.path.join(datasetDir, "pubkeys.offsets.npy"), mmap_mode = 'r')
+		blobPath = os.path.join(datasetDir, "pubkeys.blob")
+		if os.path.getsize(blobPath) > 0:
+			blob = np.memmap(blobPath, dtype = np.uint8, mode = 'r')
+		else: #np.memmap refuses empty files
+			blob = np.zeros(0, dtype = np.uint8)
+		self.pubKeys = PubKeyColumn(offsets, blob, self.meta["pubKeyEncoding"])
+
+@instrumentation.timed("load_transaction_values")
+def iterTextValues(path = TRANSACTIONS_FILE): #One int per line, reporting progress in bytes read
+	total = os.path.getsize(path)
+	with open(path, 'rb') as f:
+		for row, line in enumerate(f):
+			if row % PROGRESS_LINES == 0:
+				instrumentation.progress(f.tell(), total, "bytes")
+			yield int(line)
+	instrumentation.progress(total, total, "bytes")
+
+def loadTransactionValues(blockfile, datasetDir = DATASET_DIR, chain = None): #int64 values from the columnar dataset, else transactions0.txt, else streamed from the best chain
+	if datasetExists(datasetDir):
+		return Dataset(datasetDir).values
+	if os.path.exists(TRANSACTIONS_FILE):
+		return np.fromiter(iterTextValues(TRANSACTIONS_FILE), dtype = np.int64)
+	return np.fromiter(tx_decoder.iterTransactionValues([blockfile], chain), dtype = np.int64)
+
+def loadValueHeights(blockfile, datasetDir = DATASET_DIR, chain = None): #(values, block number of each) from the same sources, heights never decrease
+	#Rows of transactions0.txt are their own block numbers like the original charts
+	if datasetExists(datasetDir):
+		dataset = Dataset(datasetDir)
+		return dataset.values, dataset.heights
+	if os.path.exists(TRANSACTIONS_FILE):
+		values = loadTransactionValues(blockfile, datasetDir)
+		return values, np.arange(len(values), dtype = np.int64)
+	values = array('q')
+	heights = array('q')
+	for tx in tx_decoder.iterTransactions([blockfile], chain):
+		values.append(tx.value())
+		heights.append(tx.height)
+	return np.frombuffer(values, dtype = np.int64), np.frombuffer(heights, dtype = np.int64)
+
+def blockValueRows(datasetDir = DATASET_DIR): #What one value of loadBlockValues covers, transactions0.txt and datasets exported from it give one per line
+	if datasetExists(datasetDir):
+		return "blocks" if Dataset(datasetDir).meta["pubKeyEncoding"] == "raw" else "transactions"
+	return "transactions" if os.path.exists(TRANSACTIONS_FILE) else "blocks"
+
+def loadBlockValues(blockfile, datasetDir = DATASET_DIR, chain = None): #Total output value per block for the block range charts, from the same sources
+	#transactions0.txt (and datasets exported from it) are charted per line like the original charts
+	if datasetExists(datasetDir):
+		dataset = Dataset(datasetDir)
+		if dataset.meta["pubKeyEncoding"] == "raw": #One row per transaction with its real height
+			return window_aggregates.blockTotals(dataset.values, dataset.heights)
+		return dataset.values
+	if os.path.exists(TRANSACTIONS_FILE):
+		return loadTransactionValues(blockfile, datasetDir)
+	totals = array('q')
+	for tx in tx_decoder.iterTransactions([blockfile], chain):
+		if tx.txIndex == 0: #Coinbase, a new block
+			totals.append(0)
+		totals[-1] += tx.value()
+	return np.frombuffer(totals, dtype = np.int64)
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} [blockfile ...]"
+	if len(sys.argv) > 1: #Export from the given blk files
+		exportBlockFiles(sys.argv[1:])
+	elif os.path.exists(TRANSACTIONS_FILE): #Export from the pre-extracted text files
+		exportTextFiles()
+	else:
+		print(usage.format(sys.argv[0]))
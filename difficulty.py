@@ -0,0 +1,78 @@
+import numpy as np
+
+import chain_index
+import instrumentation
+
+############################################################################################################
+################################################ DIFFICULTY ################################################
+#Per-height columns of the best chain, decoded from BlockHeader.bits without any big integers:
+#difficulty/time.npy, bits.npy, difficulty.npy and work.npy, the running total of block work before each
+#height (one extra entry, like the prefix index), plus blockKeys.npy. New heights are appended, nothing already stored
+#is redone unless a reorg replaced it.
+
+DIFFICULTY_DIR = "difficulty"
+RETARGET_INTERVAL = 2016 #Blocks between difficulty adjustments
+HASHRATE_WINDOW = 144 #About a day of blocks
+MAX_TARGET = chain_index.decodeTarget(0x1d00ffff) #Difficulty 1
+COLUMNS = ("time", "bits", "difficulty", "work")
+DTYPES = (np.int64, np.uint32, np.float64, np.float64)
+
+def difficultyFromBits(bits):
+	target = chain_index.decodeTarget(bits)
+	return np.where(target > 0, MAX_TARGET / np.maximum(target, 1), 0.0)
+
+class DifficultySeries(chain_index.HeightStore):
+
+	def __init__(self, difficultyDir = DIFFICULTY_DIR):
+		chain_index.HeightStore.__init__(self, difficultyDir, list(zip(COLUMNS, DTYPES)), totals = ("work",))
+		self.difficultyDir = difficultyDir
+
+	@instrumentation.timed("difficulty.update")
+	def update(self, chain): #Decodes only the heights past the ones still on the best chain, returns how many were added
+		start = self.keptHeights(chain)
+		if start == len(self) and start >= len(chain):
+			return 0
+
+		bits = chain.mainColumn("bits")[start:]
+		return self.replace(chain, start, {"time": chain.mainColumn("time")[start:], "bits": bits,
+			"difficulty": difficultyFromBits(bits), "work": chain_index.blockWork(bits)})
+
+	def hashrate(self, window = HASHRATE_WINDOW): #Hashes per second over the window blocks ending at each height, from height window on
+		work = self.columns["work"]
+		times = self.columns["time"]
+		if len(times) <= window:
+			return np.zeros(0)
+		elapsed = np.maximum(times[window:] - times[:-window], 1) #Timestamps are not strictly increasing
+		return (work[window + 1:] - work[1:-window]) / elapsed
+
+	def windowHashrate(self, windowSize): #Average hashrate of each fixed window of heights, for the bar charts
+		work = self.columns["work"]
+		times = self.columns["time"]
+		starts = np.arange(0, len(times), windowSize)
+		ends = np.minimum(starts + windowSize, len(times))
+		first = np.maximum(starts, 1) #The first window has no time before block 0, its work is counted from block 1
+		elapsed = np.maximum(times[ends - 1] - times[first - 1], 1)
+		return (work[ends] - work[first]) / elapsed
+
+	def retargets(self, interval = RETARGET_INTERVAL): #Adjustment heights with the new difficulty and the change from the period before
+		heights = np.arange(interval, len(self), interval)
+		difficulty = self.columns["difficulty"]
+		return {"height": heights.tolist(), "time": self.columns["time"][heights].tolist(),
+			"difficulty": difficulty[heights].tolist(), "change": (difficulty[heights] / difficulty[heights - 1]).tolist()}
+
+def updateDifficulty(blockfiles, difficultyDir = DIFFICULTY_DIR):
+	series = DifficultySeries(difficultyDir)
+	series.update(chain_index.loadChain(blockfiles))
+	return series
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		series = updateDifficulty(sys.argv[1:])
+		print("%d heights, difficulty %.2f, %d retargets" % (len(series), series["difficulty"][-1], len(series.retargets()["height"])))
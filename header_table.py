@@ -0,0 +1,192 @@
+import hashlib
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import atomic_files
+import block_index
+import block_reader
+import instrumentation
+
+############################################################################################################
+################################################ HEADER TABLE ##############################################
+#One column per header field, rows in blk file order. Hashes are (n, 32) uint8 in the same byte order as
+#BlockHeader.previousHash. Saved as headers/<column>.npy. Offsets, sizes, tx counts and hashes are shared
+#with each file's block_index sidecar, so a header is only hashed the first time it is scanned.
+
+HEADER_DIR = "headers"
+COLUMNS = ("fileNumber", "offset", "blocksize", "version", "previousHash", "merkleHash", "time", "bits", "nonce", "txCount", "hash")
+
+def scanOffsets(bf, offset = 0): #Block offsets and sizes of one mapped file from offset on, jumping blocksize + 8 bytes at a time
+	offsets = array('q')
+	sizes = array('q')
+	buf = bf.buffer
+	end = len(buf)
+	unpack_from = block_reader.BLOCK_PREFIX.unpack_from
+	while offset + 8 <= end:
+		magic_no, blocksize = unpack_from(buf, offset)
+		if magic_no != block_reader.MAGIC_NO or offset + 8 + blocksize > end:
+			break
+		offsets.append(offset)
+		sizes.append(blocksize)
+		offset += blocksize + 8
+	return np.frombuffer(offsets, dtype = np.int64), np.frombuffer(sizes, dtype = np.int64)
+
+def decodeHeaders(bf, fileNumber, index = None): #Gathers every 80 byte header of the file at once and splits it into columns
+	#Blocks already in the sidecar index keep its offsets, sizes, tx counts and hashes, only blocks after them are scanned
+	known = len(index) if index is not None else 0
+	start = 0
+	if known:
+		start = index.offsets[-1] + index.sizes[-1] + block_reader.BLOCK_PREFIX.size
+	newOffsets, newSizes = scanOffsets(bf, start)
+	if known:
+		offsets = np.concatenate((np.frombuffer(index.offsets, dtype = np.uint64).astype(np.int64), newOffsets))
+		sizes = np.concatenate((np.frombuffer(index.sizes, dtype = np.uint32).astype(np.int64), newSizes))
+	else:
+		offsets, sizes = newOffsets, newSizes
+
+	raw = np.frombuffer(bf.buffer, dtype = np.uint8)
+	headers = raw[(offsets + 8)[:, None] + np.arange(block_reader.HEADER_SIZE + 1)] #Header plus first byte of the tx count
+	del raw #The map can only be closed once no array points into it
+
+	txCount = headers[:, 80].astype(np.uint32)
+	if known:
+		txCount[:known] = np.frombuffer(index.txCounts, dtype = np.uint32)
+	for i in known + np.nonzero(txCount[known:] >= 0xfd)[0]: #Multi-byte varints are rare enough to read one by one
+		txCount[i] = block_reader.read_varint_at(bf.buffer, int(offsets[i]) + 8 + block_reader.HEADER_SIZE)[0]
+
+	header80 = np.ascontiguousarray(headers[:, :80])
+	columns = {
+		"fileNumber": np.full(len(offsets), fileNumber, dtype = np.uint32),
+		"offset": offsets.astype(np.uint64),
+		"blocksize": sizes.astype(np.uint32),
+		"version": header80[:, 0:4].copy().view('<u4').ravel(),
+		"previousHash": header80[:, 35:3:-1].copy(),
+		"merkleHash": header80[:, 67:35:-1].copy(),
+		"time": header80[:, 68:72].copy().view('<u4').ravel(),
+		"bits": header80[:, 72:76].copy().view('<u4').ravel(),
+		"nonce": header80[:, 76:80].copy().view('<u4').ravel(),
+		"txCount": txCount,
+	}
+	hashes = np.empty((len(offsets), 32), dtype = np.uint8)
+	if known:
+		hashes[:known] = np.frombuffer(bytes(index.hashes), dtype = np.uint8).reshape(known, 32)
+	sha256 = hashlib.sha256
+	for i in range(known, len(offsets)):
+		hashes[i] = np.frombuffer(sha256(sha256(header80[i]).digest()).digest()[::-1], dtype = np.uint8)
+	columns["hash"] = hashes
+	return columns
+
+def saveSidecar(blockfile, fileSize, columns): #Writes the columns block_index keeps back to the file's sidecar
+	index = block_index.BlockFileIndex(block_index.blockFileNumber(blockfile))
+	index.fileSize = fileSize
+	index.offsets.frombytes(columns["offset"].astype('<u8').tobytes())
+	index.sizes.frombytes(columns["blocksize"].astype('<u4').tobytes())
+	index.txCounts.frombytes(columns["txCount"].astype('<u4').tobytes())
+	index.hashes = bytearray(columns["hash"].tobytes())
+	index.save(block_index.sidecarPath(blockfile))
+
+def scanFile(blockfile): #Header columns of one blk file, reading and extending its sidecar
+	index = block_index.loadSidecar(blockfile)
+	with block_reader.BlockFile(blockfile) as bf:
+		columns = decodeHeaders(bf, block_index.blockFileNumber(blockfile), index)
+		fileSize = bf.fileSize
+	if index is None or index.fileSize != fileSize or len(index) != len(columns["offset"]): #Preallocated files fill up without growing
+		saveSidecar(blockfile, fileSize, columns)
+	return columns
+
+def fileSources(blockfiles, previousSources = ()): #(absolute path, end of its last complete block) per file, what a build depends on
+	#Not the file size, Bitcoin Core preallocates blk files. Each walk resumes from the end an earlier build saw.
+	#The full path, the header and chain directories are shared by every data directory a caller names
+	ends = dict(previousSources)
+	paths = [os.path.abspath(blockfile) for blockfile in blockfiles]
+	return [(path, block_reader.dataEnd(path, ends.get(path, 0))) for path in paths]
+
+def fileRows(table, sources): #(path, data end) of an earlier build --> slice of its rows, rows are grouped by file
+	fileNumbers = np.asarray(table["fileNumber"]) if len(table) else np.zeros(0, dtype = np.uint32)
+	bounds = np.flatnonzero(np.diff(fileNumbers)) + 1
+	starts = np.concatenate(([0], bounds)).astype(np.int64)
+	stops = np.concatenate((bounds, [len(fileNumbers)])).astype(np.int64)
+	byNumber = dict((int(fileNumbers[start]), slice(int(start), int(stop))) for start, stop in zip(starts, stops) if stop > start)
+	return dict(((path, size), byNumber.get(block_index.blockFileNumber(path), slice(0, 0))) for path, size in sources)
+
+def unchangedSources(table, sources): #The sources of an earlier build whose file still holds the last header indexed from it
+	rows = fileRows(table, sources)
+	kept = []
+	for path, end in sources:
+		last = rows[(path, end)].stop - 1
+		if last < rows[(path, end)].start or block_index.holdsHash(path, int(table["offset"][last]), table["hash"][last].tobytes()):
+			kept.append((path, end))
+	return kept
+
+class HeaderTable(object):
+
+	def __init__(self, columns = None):
+		self.columns = columns or {}
+
+	def __len__(self):
+		return len(self.columns["time"]) if self.columns else 0
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	@instrumentation.timed("header_scan")
+	def build(self, blockfiles, previous = None, previousSources = (), workers = None, sources = None): #Rows of files unchanged since previous was built are copied over
+		#workers > 0 scans the other files in that many processes, results are merged back in file order
+		if previous is not None:
+			previousSources = unchangedSources(previous, previousSources)
+		kept = fileRows(previous, previousSources) if previous is not None else {}
+		if sources is None:
+			sources = fileSources(blockfiles, previousSources)
+		parts = [kept.get(tuple(source)) for source in sources]
+		scan = [blockfile for blockfile, rows in zip(blockfiles, parts) if rows is None] #New or grown files
+		ends = [end for (name, end), rows in zip(sources, parts) if rows is None]
+		executor = ProcessPoolExecutor(max_workers = workers) if workers and len(scan) > 1 else None
+		try:
+			results = executor.map(scanFile, scan) if executor is not None else map(scanFile, scan)
+			scanned = []
+			done = 0
+			instrumentation.progress(0, sum(ends), "bytes")
+			for end, columns in zip(ends, results): #Progress in bytes, blk files differ a lot in size
+				scanned.append(columns)
+				done += end
+				instrumentation.progress(done, sum(ends), "bytes")
+		finally:
+			if executor is not None:
+				executor.shutdown()
+		scanned = iter(scanned)
+		parts = [next(scanned) if rows is None else dict((name, previous[name][rows]) for name in COLUMNS) for rows in parts]
+		self.columns = dict((name, np.concatenate([part[name] for part in parts])) for name in COLUMNS) if parts else {}
+		return self
+
+	def save(self, headerDir = HEADER_DIR):
+		if not os.path.isdir(headerDir):
+			os.makedirs(headerDir)
+		for name in COLUMNS:
+			atomic_files.saveArray(os.path.join(headerDir, name + ".npy"), self.columns[name])
+
+	def load(self, headerDir = HEADER_DIR):
+		self.columns = dict((name, np.load(os.path.join(headerDir, name + ".npy"), mmap_mode = 'r')) for name in COLUMNS)
+		return self
+
+def loadHeaderTable(headerDir = HEADER_DIR):
+	if not os.path.exists(os.path.join(headerDir, "time.npy")):
+		return None
+	return HeaderTable().load(headerDir)
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	import time
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		start = time.time()
+		table = HeaderTable().build(sys.argv[1:])
+		table.save()
+		print("%d headers in %.2fs" % (len(table), time.time() - start))
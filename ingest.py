@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+import atomic_files
+import block_index
+import block_reader
+import chain_index
+import difficulty
+import prefix_index
+
+############################################################################################################
+################################################ DISCOVERY #################################################
+
+DATA_DIR = "."
+POLL_INTERVAL = 10 #Seconds between checks when watching
+
+def discoverBlockFiles(dataDir = DATA_DIR, firstFile = None): #Every blk*.dat in the data directory in file number order, optionally from firstFile on
+	blockfiles = block_index.discoverBlockFiles(dataDir)
+	if firstFile is not None:
+		blockfiles = [blockfile for blockfile in blockfiles if block_index.blockFileNumber(blockfile) >= block_index.blockFileNumber(firstFile)]
+	return blockfiles
+
+############################################################################################################
+################################################ INGESTOR ##################################################
+#The checkpoint holds the data directory, the last blk file read, the offset just past its last complete block and the number
+#of heights ingested so far. New blocks only tell us that something changed, the prefix index itself is
+#extended in height order from the chain index. Other modules extend it too (transaction_size_parser does),
+#so the block count is always taken from the prefix index rather than trusted from the checkpoint.
+
+class Ingestor(object):
+
+	def __init__(self, dataDir = DATA_DIR, indexDir = prefix_index.PREFIX_DIR):
+		self.dataDir = dataDir
+		self.prefixIndex = prefix_index.PrefixIndex(indexDir)
+		self.difficultySeries = difficulty.DifficultySeries()
+		self.checkpointPath = os.path.join(indexDir, "checkpoint.json")
+		self.checkpoint = self.emptyCheckpoint()
+
+		if os.path.exists(self.checkpointPath):
+			with open(self.checkpointPath, 'r') as f:
+				self.checkpoint = json.load(f)
+
+		if self.checkpoint.get("dataDir") != os.path.abspath(dataDir): #Another data directory, its files have the same names
+			self.checkpoint = self.emptyCheckpoint()
+		if self.checkpoint["blocks"] > len(self.prefixIndex): #Index rebuilt or cut short, the first pass goes over every file again
+			self.checkpoint = self.emptyCheckpoint()
+		self.checkpoint["blocks"] = len(self.prefixIndex) #Extended elsewhere: the first pass rescans the tail and adds nothing it already has
+
+	def emptyCheckpoint(self):
+		return {"dataDir": os.path.abspath(self.dataDir), "file": None, "offset": 0, "blocks": 0}
+
+	def saveCheckpoint(self):
+		atomic_files.saveJson(self.checkpointPath, self.checkpoint)
+
+	def ingestOnce(self): #Parses only the blocks written since the checkpoint, returns how many were added
+		blockfiles = discoverBlockFiles(self.dataDir)
+		names = [os.path.basename(blockfile) for blockfile in blockfiles]
+		startPos = names.index(self.checkpoint["file"]) if self.checkpoint["file"] in names else 0
+
+		newBlocks = 0
+		checkpoint = dict(self.checkpoint)
+		for filePos in range(startPos, len(blockfiles)):
+			offset = checkpoint["offset"] if names[filePos] == checkpoint["file"] else 0
+			with block_reader.BlockFile(blockfiles[filePos]) as bf:
+				for record in bf.iterBlocks(offset): #Stops before a block that is still being written
+					newBlocks += 1
+					offset = record.offset + record.blocksize + block_reader.BLOCK_PREFIX.size
+			checkpoint["file"] = names[filePos]
+			checkpoint["offset"] = offset
+
+		added = 0
+		if newBlocks: #Stale blocks add nothing
+			added = self.prefixIndex.update(blockfiles)
+			self.difficultySeries.update(chain_index.loadChain(blockfiles))
+		checkpoint["blocks"] = len(self.prefixIndex)
+		self.checkpoint = checkpoint
+		if added or not os.path.exists(self.checkpointPath):
+			if not os.path.isdir(os.path.dirname(self.checkpointPath) or "."):
+				os.makedirs(os.path.dirname(self.checkpointPath))
+			self.saveCheckpoint()
+		return added
+
+	def watch(self, interval = POLL_INTERVAL, callback = None): #Polls the data directory for new blocks until interrupted
+		while True:
+			added = self.ingestOnce()
+			if added and callback is not None:
+				callback(added)
+			time.sleep(interval)
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} [datadir] [--watch [seconds]]"
+	args = sys.argv[1:]
+	watch = "--watch" in args
+	interval = POLL_INTERVAL
+	if watch:
+		i = args.index("--watch")
+		if i + 1 < len(args) and args[i + 1].isdigit():
+			interval = int(args.pop(i + 1))
+		args.pop(i)
+
+	if len(args) > 1:
+		print(usage.format(sys.argv[0]))
+	else:
+		ingestor = Ingestor(args[0] if args else DATA_DIR)
+		print("Ingested %d new blocks, %d in total" % (ingestor.ingestOnce(), len(ingestor.prefixIndex)))
+		if watch:
+			ingestor.watch(interval, lambda added: print("Ingested %d new blocks, %d in total" % (added, len(ingestor.prefixIndex))))
@@ -0,0 +1,168 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import resource
+import threading
+import time
+
+############################################################################################################
+################################################ SETTINGS ##################################################
+#BCA_METRICS=1 turns the timers and counters on. BCA_PROFILE=cprofile additionally profiles everything run
+#inside a timed stage, BCA_PROFILE=tracemalloc tracks Python allocations. With neither set, timed()
+#hands back the undecorated function and stage()/count() return straight away.
+
+ENABLED = os.environ.get("BCA_METRICS", "") not in ("", "0") or bool(os.environ.get("BCA_PROFILE"))
+PROFILE = os.environ.get("BCA_PROFILE", "").lower()
+PREFIX = "bca"
+
+lock = threading.Lock()
+timers = {} #Stage name --> [calls, wall seconds, cpu seconds]
+counters = {} #Counter name --> total
+caches = [] #(label, ChartCache)
+
+profiler = cProfile.Profile() if PROFILE == "cprofile" else None
+profileDepth = [0] #Nested stages share one enable/disable of the profiler
+
+if PROFILE == "tracemalloc":
+	import tracemalloc
+	tracemalloc.start()
+
+############################################################################################################
+################################################ TIMERS AND COUNTERS #######################################
+
+class Stage(object): #Context manager adding wall and CPU time to one timer
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		if profiler is not None:
+			with lock:
+				if profileDepth[0] == 0:
+					profiler.enable()
+				profileDepth[0] += 1
+		self.wall = time.perf_counter()
+		self.cpu = time.thread_time()
+		return self
+
+	def __exit__(self, *exc):
+		wall = time.perf_counter() - self.wall
+		cpu = time.thread_time() - self.cpu
+		with lock:
+			timer = timers.setdefault(self.name, [0, 0.0, 0.0])
+			timer[0] += 1
+			timer[1] += wall
+			timer[2] += cpu
+			if profiler is not None:
+				profileDepth[0] -= 1
+				if profileDepth[0] == 0:
+					profiler.disable()
+		return False
+
+class NullStage(object):
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+NULL_STAGE = NullStage()
+
+def stage(name): #with instrumentation.stage("name"): ...
+	return Stage(name) if ENABLED else NULL_STAGE
+
+def timed(name): #Decorator form of stage(), a no-op when instrumentation is off
+	def decorator(function):
+		if not ENABLED:
+			return function
+
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			with Stage(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorator
+
+def count(name, n = 1): #Bytes, blocks, transactions...
+	if ENABLED:
+		with lock:
+			counters[name] = counters.get(name, 0) + n
+
+def addTime(name, seconds, calls = 1): #For code that already measures itself, e.g. scan_engine plugins
+	if ENABLED:
+		with lock:
+			timer = timers.setdefault(name, [0, 0.0, 0.0])
+			timer[0] += calls
+			timer[1] += seconds
+
+############################################################################################################
+################################################ PROGRESS ##################################################
+#Long passes report how far they got whether metrics are on or not, background_jobs turns it into /status
+
+progressHooks = [] #Callables taking (done, total, unit) for the pass running now
+
+def progress(done, total, unit = "blocks"):
+	for hook in progressHooks:
+		hook(done, total, unit)
+
+############################################################################################################
+################################################ EXPORT ####################################################
+
+def escape(value):
+	return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheusText(): #Prometheus text exposition format 0.0.4
+	with lock:
+		timerItems = sorted((name, list(values)) for name, values in timers.items())
+		counterItems = sorted(counters.items())
+
+	lines = []
+	def metric(name, kind, helpText, samples):
+		lines.append("# HELP %s_%s %s" % (PREFIX, name, helpText))
+		lines.append("# TYPE %s_%s %s" % (PREFIX, name, kind))
+		for labels, value in samples:
+			labelText = ",".join('%s="%s"' % (key, escape(val)) for key, val in labels)
+			lines.append("%s_%s%s %s" % (PREFIX, name, "{%s}" % labelText if labelText else "", repr(float(value)) if isinstance(value, float) else value))
+
+	metric("instrumentation_enabled", "gauge", "1 when BCA_METRICS or BCA_PROFILE is set", [((), int(ENABLED))])
+	metric("stage_calls_total", "counter", "Times each stage ran", [((("stage", name),), values[0]) for name, values in timerItems])
+	metric("stage_seconds_total", "counter", "Wall time spent in each stage", [((("stage", name),), values[1]) for name, values in timerItems])
+	metric("stage_cpu_seconds_total", "counter", "CPU time of the thread running each stage", [((("stage", name),), values[2]) for name, values in timerItems])
+	for name, value in counterItems:
+		metric(name + "_total", "counter", "Counter %s" % name, [((), value)])
+
+	hits = [((("cache", label),), cache.hits) for label, cache in caches]
+	misses = [((("cache", label),), cache.misses) for label, cache in caches]
+	ratios = [((("cache", label),), float(cache.hits) / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0) for label, cache in caches]
+	metric("chart_cache_hits_total", "counter", "Chart pages served from the cache", hits)
+	metric("chart_cache_misses_total", "counter", "Chart pages rendered", misses)
+	metric("chart_cache_hit_ratio", "gauge", "hits / (hits + misses)", ratios)
+	metric("chart_cache_entries", "gauge", "Pages currently cached", [((("cache", label),), len(cache.entries)) for label, cache in caches])
+
+	metric("process_max_rss_kilobytes", "gauge", "Peak resident set size", [((), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)])
+	if PROFILE == "tracemalloc":
+		current, peak = tracemalloc.get_traced_memory()
+		metric("tracemalloc_current_bytes", "gauge", "Python memory currently allocated", [((), current)])
+		metric("tracemalloc_peak_bytes", "gauge", "Most Python memory allocated at once", [((), peak)])
+	return "\n".join(lines) + "\n"
+
+def profileText(limit = 40): #Top functions by cumulative time, or the top allocation sites
+	if profiler is not None:
+		out = io.StringIO()
+		with lock:
+			pstats.Stats(profiler, stream = out).sort_stats("cumulative").print_stats(limit)
+		return out.getvalue()
+	if PROFILE == "tracemalloc":
+		return "\n".join(str(stat) for stat in tracemalloc.take_snapshot().statistics("lineno")[:limit]) + "\n"
+	return "Profiling is off, set BCA_PROFILE=cprofile or BCA_PROFILE=tracemalloc\n"
+
+def register(app, chartCache = None): #Adds GET /metrics (and /metrics/profile) to a Flask app, labels its chart cache
+	from flask import Response
+
+	if chartCache is not None:
+		caches.append((app.import_name, chartCache))
+	app.add_url_rule("/metrics", "metrics", lambda: Response(prometheusText(), mimetype = "text/plain; version=0.0.4"))
+	app.add_url_rule("/metrics/profile", "metrics_profile", lambda: Response(profileText(), mimetype = "text/plain"))
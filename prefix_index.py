@@ -0,0 +1,66 @@
+from array import array
+
+import numpy as np
+
+import chain_index
+import instrumentation
+import tx_decoder
+
+############################################################################################################
+################################################ PREFIX SUMS ###############################################
+#prefix/<metric>.npy holds the running total before each block of the best chain, entry 0 is 0 and entry n the total of
+#heights 0..n-1, so the total of any height range is two lookups. prefix/blockKeys.npy holds the block key of each
+#height, after a reorg the totals are cut back to the fork point and the new branch is added from there
+
+PREFIX_DIR = "prefix"
+METRICS = ("txCount", "outputValue", "blockSize")
+
+def newColumns():
+	return dict((metric, array('q')) for metric in METRICS)
+
+def addBlock(columns, buf, record): #Per-block values of one mapped block
+	columns["txCount"].append(record.transaction_count)
+	columns["blockSize"].append(record.blocksize)
+	columns["outputValue"].append(sum(tx.value() for tx in tx_decoder.iterBlockTransactions(buf, record, 0)))
+
+class PrefixIndex(chain_index.HeightStore):
+
+	def __init__(self, indexDir = PREFIX_DIR):
+		chain_index.HeightStore.__init__(self, indexDir, [(metric, np.int64) for metric in METRICS], totals = METRICS)
+		self.indexDir = indexDir
+
+	@instrumentation.timed("prefix_index.update")
+	def update(self, blockfiles): #Appends only the heights past the ones still on the best chain, returns how many were added
+		chain = chain_index.loadChain(blockfiles)
+		start = self.keptHeights(chain)
+		if start == len(self) and start >= len(chain):
+			return 0
+
+		columns = newColumns()
+		for blockfile, buf, record, height in chain_index.iterChainBlocks(blockfiles, chain, start):
+			addBlock(columns, buf, record)
+		return self.replace(chain, start, columns)
+
+	def perBlock(self, metric): #Per-block values back out of the running totals
+		return np.diff(self.columns[metric])
+
+	def rangeSum(self, metric, start, end): #Total of blocks start..end inclusive
+		sums = self.columns[metric]
+		return int(sums[end + 1] - sums[start])
+
+	def rangeTotals(self, start, end):
+		totals = {"start": start, "end": end, "blocks": end - start + 1}
+		for metric in METRICS:
+			totals[metric] = self.rangeSum(metric, start, end)
+		return totals
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		print("Indexed %d new blocks" % PrefixIndex().update(sys.argv[1:]))
@@ -0,0 +1,104 @@
+import numpy as np
+
+import chain_index
+import instrumentation
+import tx_decoder
+import window_aggregates
+
+############################################################################################################
+################################################ SUBSIDY ###################################################
+#Heights count from the first block of the best chain, so the blk files have to start at the genesis block
+
+COIN = 100000000
+HALVING_INTERVAL = 210000
+INITIAL_SUBSIDY = 50 * COIN
+HALVINGS = 64 #The subsidy is shifted out to 0 after this many halvings
+MAX_HEIGHT = 2 ** 63 - 1 #Heights are int64 everywhere else
+
+def subsidy(heights): #New coins a block at each height may claim, in satoshis
+	halvings = np.asarray(heights, dtype = np.int64) // HALVING_INTERVAL
+	return np.where(halvings < HALVINGS, INITIAL_SUBSIDY >> np.minimum(halvings, HALVINGS - 1), 0)
+
+def subsidyBefore(height): #Total subsidy of heights 0..height-1, whole epochs at once, nothing is paid after the 64th
+	epochs = min(height // HALVING_INTERVAL, HALVINGS)
+	total = sum(INITIAL_SUBSIDY >> epoch for epoch in range(epochs)) * HALVING_INTERVAL
+	if epochs < HALVINGS:
+		total += (INITIAL_SUBSIDY >> epochs) * (height - epochs * HALVING_INTERVAL)
+	return total
+
+def subsidyTotal(start, end): #Total subsidy of heights start..end inclusive
+	return subsidyBefore(end + 1) - subsidyBefore(start)
+
+def rangeLabel(start, end): #Same style as the original chart labels, "0 - 209,999"
+	return "{:,} - {:,}".format(start, end)
+
+############################################################################################################
+################################################ REWARDS ###################################################
+#rewards/coinbase.npy holds the output total of each height's coinbase transaction in satoshis. Fees are
+#that total minus the subsidy; a miner who claimed less than allowed counts as zero fees, not negative.
+#rewards/blockKeys.npy holds the block key of each height, heights a reorg replaced are decoded again.
+
+REWARDS_DIR = "rewards"
+
+class RewardSeries(chain_index.HeightStore):
+
+	def __init__(self, rewardsDir = REWARDS_DIR):
+		chain_index.HeightStore.__init__(self, rewardsDir, [("coinbase", np.int64)])
+		self.rewardsDir = rewardsDir
+
+	@instrumentation.timed("rewards.update")
+	def update(self, blockfiles): #Decodes the coinbase of every height past the ones still on the best chain, returns how many were added
+		chain = chain_index.loadChain(blockfiles)
+		start = self.keptHeights(chain)
+		if start == len(self) and start >= len(chain):
+			return 0
+
+		added = np.zeros(len(chain) - start, dtype = np.int64)
+		for blockfile, buf, record, height in chain_index.iterChainBlocks(blockfiles, chain, start):
+			for tx in tx_decoder.iterBlockTransactions(buf, record, height): #Only the first transaction is decoded
+				added[height - start] = tx.value()
+				break
+		return self.replace(chain, start, {"coinbase": added})
+
+	def subsidies(self, stop = None): #Of heights 0..stop-1, every height by default
+		return subsidy(np.arange(len(self))[:stop])
+
+	def fees(self, stop = None):
+		return np.maximum(self.columns["coinbase"][:stop] - self.subsidies(stop), 0)
+
+	def windowTotals(self, windowSize = HALVING_INTERVAL, stop = None): #Subsidy, fees and coinbase totals per window of heights 0..stop-1, halving epochs by default
+		stats = window_aggregates.windowAggregate(self.columns["coinbase"][:stop], windowSize)
+		ends = stats.starts + stats.counts - 1
+		return {"start": stats.starts.tolist(), "end": ends.tolist(), "blocks": stats.counts.tolist(),
+			"coinbase": stats.sums.tolist(),
+			"subsidy": window_aggregates.windowAggregate(self.subsidies(stop), windowSize).sums.tolist(),
+			"fees": window_aggregates.windowAggregate(self.fees(stop), windowSize).sums.tolist()}
+
+	def chartData(self, windowSize = HALVING_INTERVAL, stop = None): #Average subsidy and fees per block (BTC) for each window
+		totals = self.windowTotals(windowSize, stop)
+		blocks = np.asarray(totals["blocks"], dtype = np.float64)
+		chartData = {"Block": [rangeLabel(start, end) for start, end in zip(totals["start"], totals["end"])]}
+		chartData["Subsidy"] = (np.asarray(totals["subsidy"]) / blocks / COIN).tolist()
+		chartData["Fees"] = (np.asarray(totals["fees"]) / blocks / COIN).tolist()
+		chartData["Reward"] = [s + f for s, f in zip(chartData["Subsidy"], chartData["Fees"])]
+		return chartData
+
+def updateRewards(blockfiles, rewardsDir = REWARDS_DIR):
+	series = RewardSeries(rewardsDir)
+	series.update(blockfiles)
+	return series
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		series = updateRewards(sys.argv[1:])
+		totals = series.windowTotals()
+		for i in range(len(totals["start"])):
+			print("%s: %.8f BTC subsidy, %.8f BTC fees" % (rangeLabel(totals["start"][i], totals["end"][i]),
+				totals["subsidy"][i] / float(COIN), totals["fees"][i] / float(COIN)))
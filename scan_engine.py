@@ -0,0 +1,223 @@
+import time
+from array import array
+
+import numpy as np
+
+import chain_index
+import instrumentation
+import top_transactions
+import tx_decoder
+import value_histogram
+
+############################################################################################################
+################################################ PLUGIN API ################################################
+#A plugin overrides only the hooks it needs, the engine never calls (or decodes for) the others.
+#Hooks run in height order over the best chain; buffers and records are only valid during the call,
+#so anything kept past it has to be copied. finish() returns the plugin's result.
+
+class ScanPlugin(object):
+
+	name = None
+
+	def on_block(self, buf, record, height):
+		pass
+
+	def on_tx(self, tx):
+		pass
+
+	def on_output(self, tx, outputIndex, output):
+		pass
+
+	def finish(self):
+		return None
+
+def overrides(plugin, hook):
+	return getattr(type(plugin), hook) is not getattr(ScanPlugin, hook)
+
+############################################################################################################
+################################################ ENGINE ####################################################
+
+class ScanEngine(object): #One decode pass over the blk files feeding every registered plugin
+
+	def __init__(self, plugins = ()):
+		self.plugins = []
+		self.timings = {} #Plugin name --> seconds spent in its hooks and finish()
+		self.decodeSeconds = 0.0 #Everything else: mapping, walking blocks and decoding transactions
+		for plugin in plugins:
+			self.register(plugin)
+
+	def register(self, plugin):
+		if any(p.name == plugin.name for p in self.plugins):
+			raise ValueError("plugin %s is already registered" % plugin.name)
+		self.plugins.append(plugin)
+		return plugin
+
+	@instrumentation.timed("scan_engine.run")
+	def run(self, blockfiles):
+		hooks = dict((hook, [(p.name, getattr(p, hook)) for p in self.plugins if overrides(p, hook)]) for hook in ("on_block", "on_tx", "on_output"))
+		blockHooks = hooks["on_block"]
+		txHooks = hooks["on_tx"]
+		outputHooks = hooks["on_output"]
+		timings = dict((p.name, 0.0) for p in self.plugins)
+		clock = time.perf_counter
+		start = clock()
+
+		for blockfile, buf, record, height in chain_index.iterChainBlocks(blockfiles):
+			for name, hook in blockHooks:
+				t = clock()
+				hook(buf, record, height)
+				timings[name] += clock() - t
+			if not txHooks and not outputHooks:
+				continue
+			for tx in tx_decoder.iterBlockTransactions(buf, record, height):
+				for name, hook in txHooks:
+					t = clock()
+					hook(tx)
+					timings[name] += clock() - t
+				if outputHooks:
+					for outputIndex, output in enumerate(tx.outputs()):
+						for name, hook in outputHooks:
+							t = clock()
+							hook(tx, outputIndex, output)
+							timings[name] += clock() - t
+
+		results = {}
+		for plugin in self.plugins:
+			t = clock()
+			results[plugin.name] = plugin.finish()
+			timings[plugin.name] += clock() - t
+		self.timings = timings
+		self.decodeSeconds = clock() - start - sum(timings.values())
+		for name, seconds in timings.items():
+			instrumentation.addTime("scan_engine.plugin." + name, seconds)
+		instrumentation.addTime("scan_engine.decode", self.decodeSeconds)
+		return results
+
+	def report(self): #Plugins slowest first, then the shared decode time
+		lines = ["%-16s %8.3fs" % (name, seconds) for name, seconds in sorted(self.timings.items(), key = lambda item: -item[1])]
+		lines.append("%-16s %8.3fs" % ("(decode)", self.decodeSeconds))
+		return "\n".join(lines)
+
+############################################################################################################
+################################################ PLUGINS ###################################################
+#One per analysis: transaction_size_parser (txCount, sizeStats), transaction_counter (blockValues),
+#transaction_value_ranges (valueHistogram), valuable_transactions (topTransactions), block_rewards (rewards)
+
+class TxCountPlugin(ScanPlugin): #Transactions per block
+
+	name = "txCount"
+
+	def __init__(self):
+		self.counts = array('q')
+
+	def on_block(self, buf, record, height):
+		self.counts.append(record.transaction_count)
+
+	def finish(self):
+		return np.frombuffer(self.counts, dtype = np.int64)
+
+class SizeStatsPlugin(ScanPlugin): #Bytes and weight per block
+
+	name = "sizeStats"
+
+	def __init__(self):
+		self.blockSize = array('q')
+		self.weight = array('q')
+
+	def on_block(self, buf, record, height):
+		self.blockSize.append(record.blocksize)
+		self.weight.append(0)
+
+	def on_tx(self, tx):
+		self.weight[-1] += tx.weight()
+
+	def finish(self):
+		return {"blockSize": np.frombuffer(self.blockSize, dtype = np.int64), "weight": np.frombuffer(self.weight, dtype = np.int64)}
+
+class TxValuesPlugin(ScanPlugin): #Total output value of every transaction, the column transactions0.txt holds
+
+	name = "txValues"
+
+	def __init__(self):
+		self.values = array('q')
+
+	def on_tx(self, tx):
+		self.values.append(tx.value())
+
+	def finish(self):
+		return np.frombuffer(self.values, dtype = np.int64)
+
+class BlockValuesPlugin(ScanPlugin): #Total output value per block, out of the values collected by a TxValuesPlugin
+
+	name = "blockValues"
+
+	def __init__(self, valuesPlugin):
+		self.valuesPlugin = valuesPlugin
+		self.starts = array('q') #Index of each block's first value
+
+	def on_block(self, buf, record, height):
+		self.starts.append(len(self.valuesPlugin.values))
+
+	def finish(self):
+		values = np.frombuffer(self.valuesPlugin.values, dtype = np.int64)
+		if len(values) == 0:
+			return np.zeros(0, dtype = np.int64)
+		return np.add.reduceat(values, np.frombuffer(self.starts, dtype = np.int64))
+
+class ValueHistogramPlugin(ScanPlugin): #Bins the values collected by a TxValuesPlugin instead of summing every transaction again
+
+	name = "valueHistogram"
+
+	def __init__(self, valuesPlugin, edges = value_histogram.DEFAULT_EDGES):
+		self.valuesPlugin = valuesPlugin
+		self.edges = edges
+
+	def finish(self):
+		return value_histogram.histogram(np.frombuffer(self.valuesPlugin.values, dtype = np.int64), self.edges)
+
+class TopTransactionsPlugin(ScanPlugin): #Most valuable transactions with their height, position and largest output's script
+
+	name = "topTransactions"
+
+	def __init__(self, k):
+		self.top = top_transactions.TopK(k)
+
+	def on_tx(self, tx):
+		value = tx.value()
+		if self.top.accepts(value):
+			self.top.push(top_transactions.transactionEntry(tx, value))
+
+	def finish(self):
+		return self.top
+
+class RewardsPlugin(ScanPlugin): #Coinbase total per height, a RewardSeries is filled from it
+
+	name = "rewards"
+
+	def __init__(self):
+		self.coinbase = array('q')
+
+	def on_tx(self, tx):
+		if tx.txIndex == 0:
+			self.coinbase.append(tx.value())
+
+	def finish(self):
+		return np.frombuffer(self.coinbase, dtype = np.int64)
+
+def defaultEngine(topK = 100): #Every analysis the charts need, registered on one engine
+	values = TxValuesPlugin()
+	return ScanEngine([TxCountPlugin(), SizeStatsPlugin(), values, BlockValuesPlugin(values), ValueHistogramPlugin(values), TopTransactionsPlugin(topK), RewardsPlugin()])
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		engine = defaultEngine()
+		results = engine.run(sys.argv[1:])
+		print("%d blocks, %d transactions" % (len(results["txCount"]), len(results["txValues"])))
+		print(engine.report())
@@ -0,0 +1,128 @@
+import os
+from array import array
+
+import numpy as np
+
+import atomic_files
+import tx_decoder
+
+############################################################################################################
+################################################ SCRIPT TABLE ##############################################
+#Every distinct scriptPubKey gets a dense id in order of first appearance. Per-script totals live in
+#parallel arrays indexed by that id rather than in one Python object per script. A saved table loads
+#memory mapped and read-only: no id dict and no bytes object per script, scripts are sliced from the blob.
+
+SCRIPTS_DIR = "scripts"
+COLUMNS = (("received", 'q'), ("outputCount", 'I'), ("firstSeen", 'I'), ("lastSeen", 'I'))
+
+class ScriptTable(object):
+
+	def __init__(self):
+		self.ids = {} #Raw script bytes --> id, None once loaded
+		self.scripts = [] #Same bytes objects by id, no extra copies
+		self.offsets = None #Loaded tables: start of each script in the mapped blob, one extra entry for the end
+		self.blob = None
+		self.received = array('q')
+		self.outputCount = array('I')
+		self.firstSeen = array('I')
+		self.lastSeen = array('I')
+
+	def __len__(self):
+		return len(self.outputCount)
+
+	def intern(self, script):
+		if self.ids is None:
+			raise ValueError("a loaded script table is read-only")
+		scriptId = self.ids.get(script)
+		if scriptId is None:
+			script = bytes(script)
+			scriptId = self.ids[script] = len(self.scripts)
+			self.scripts.append(script)
+			self.received.append(0)
+			self.outputCount.append(0)
+			self.firstSeen.append(0)
+			self.lastSeen.append(0)
+		return scriptId
+
+	def addOutput(self, script, value, height):
+		scriptId = self.intern(script)
+		if self.outputCount[scriptId] == 0:
+			self.firstSeen[scriptId] = height
+		self.received[scriptId] += value
+		self.outputCount[scriptId] += 1
+		self.lastSeen[scriptId] = height
+		return scriptId
+
+	def script(self, scriptId):
+		if self.blob is not None:
+			return self.blob[self.offsets[scriptId]:self.offsets[scriptId + 1]].tobytes()
+		return self.scripts[scriptId]
+
+	def column(self, name): #numpy view of a column, built (array.array) or memory mapped alike
+		return np.frombuffer(getattr(self, name), dtype = np.dtype(dict(COLUMNS)[name]))
+
+	def mostPaid(self, k): #[(script id, received satoshis, outputs)] largest first
+		received = self.column("received")
+		k = min(k, len(received))
+		if k == 0:
+			return []
+		best = np.argpartition(received, len(received) - k)[len(received) - k:]
+		best = best[np.argsort(-received[best], kind = 'stable')]
+		return [(int(i), int(received[i]), int(self.outputCount[i])) for i in best]
+
+	def reuse(self): #How many scripts were paid more than once and how many outputs went to them
+		counts = self.column("outputCount")
+		reused = counts > 1
+		return {"scripts": len(counts), "reusedScripts": int(reused.sum()), "outputs": int(counts.sum()),
+			"outputsToReusedScripts": int(counts[reused].sum())}
+
+	def save(self, scriptsDir = SCRIPTS_DIR): #scripts.blob + scripts.offsets.npy plus one .npy per column
+		if not os.path.isdir(scriptsDir):
+			os.makedirs(scriptsDir)
+		offsets = array('q', [0])
+		def writeBlob(f):
+			for script in self.scripts:
+				f.write(script)
+				offsets.append(offsets[-1] + len(script))
+		atomic_files.replaceFile(os.path.join(scriptsDir, "scripts.blob"), writeBlob)
+		for name, typecode in COLUMNS:
+			atomic_files.saveArray(os.path.join(scriptsDir, name + ".npy"), self.column(name))
+		atomic_files.saveArray(os.path.join(scriptsDir, "scripts.offsets.npy"), np.frombuffer(offsets, dtype = np.int64)) #Last, the chart cache watches it
+
+	def load(self, scriptsDir = SCRIPTS_DIR):
+		self.offsets = np.load(os.path.join(scriptsDir, "scripts.offsets.npy"), mmap_mode = 'r')
+		blobPath = os.path.join(scriptsDir, "scripts.blob")
+		if os.path.getsize(blobPath) > 0:
+			self.blob = np.memmap(blobPath, dtype = np.uint8, mode = 'r')
+		else: #np.memmap refuses empty files
+			self.blob = np.zeros(0, dtype = np.uint8)
+		self.ids = None
+		self.scripts = None
+		for name, typecode in COLUMNS:
+			setattr(self, name, np.load(os.path.join(scriptsDir, name + ".npy"), mmap_mode = 'r'))
+		return self
+
+def buildScriptTable(blockfiles): #Totals for every script paid in the blockfiles
+	table = ScriptTable()
+	for tx in tx_decoder.iterTransactions(blockfiles):
+		for output in tx.outputs():
+			table.addOutput(output.scriptPubKey, output.value, tx.height)
+	return table
+
+def loadScriptTable(scriptsDir = SCRIPTS_DIR):
+	if not os.path.exists(os.path.join(scriptsDir, "scripts.offsets.npy")):
+		return None
+	return ScriptTable().load(scriptsDir)
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		table = buildScriptTable(sys.argv[1:])
+		table.save()
+		print(table.reuse())
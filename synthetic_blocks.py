@@ -0,0 +1,178 @@
+import hashlib
+import os
+import random
+import struct
+
+import block_reader
+import tx_decoder
+
+############################################################################################################
+################################################ SYNTHETIC CHAIN ###########################################
+#Writes blk*.dat files that parse like mainnet ones: linked headers with real merkle roots, a coinbase per
+#block and ordinary transactions spending earlier outputs. The same config and seed always give the same bytes.
+
+DEFAULT_CONFIG = {
+	"blocks": 1000,
+	"txPerBlock": (1, 200), #Min/max transactions per block including the coinbase, drawn uniformly
+	"inputs": (1, 3),
+	"outputs": (1, 3),
+	"scriptSize": (22, 107), #Bytes, scriptSig and scriptPubKey alike
+	"segwit": 0.0, #Share of non-coinbase transactions serialized with witness data
+	"witnessItems": (1, 2),
+	"witnessSize": (33, 73),
+	"fileSize": 128 * 1024 * 1024, #A new blk file is started once this many bytes are written
+	"padding": 0, #Zero bytes after the last block of each file, like preallocated blk files
+	"seed": 1,
+	"startTime": 1231006505,
+	"bits": 0x1d00ffff,
+}
+
+def varint(n):
+	if n < 0xfd:
+		return struct.pack('<B', n)
+	if n <= 0xffff:
+		return b'\xfd' + struct.pack('<H', n)
+	if n <= 0xffffffff:
+		return b'\xfe' + struct.pack('<I', n)
+	return b'\xff' + struct.pack('<Q', n)
+
+def doubleSha256(data):
+	return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def merkleRoot(txids): #Internal byte order, odd levels repeat their last hash
+	level = list(txids)
+	while len(level) > 1:
+		if len(level) % 2:
+			level.append(level[-1])
+		level = [doubleSha256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+	return level[0]
+
+class SyntheticChain(object):
+
+	def __init__(self, config = None):
+		self.config = dict(DEFAULT_CONFIG)
+		self.config.update(config or {})
+		self.rng = random.Random(self.config["seed"])
+		self.unspent = [] #(txid, output index, value) available to later transactions
+		self.previousHash = b'\x00' * 32
+		self.height = 0
+
+	def between(self, name):
+		low, high = self.config[name]
+		return self.rng.randint(low, high)
+
+	def randomBytes(self, name):
+		size = self.between(name)
+		return self.rng.getrandbits(8 * size).to_bytes(size, 'little')
+
+	def script(self):
+		return self.randomBytes("scriptSize")
+
+	def transaction(self, coinbase, fees = 0): #Returns (serialized bytes, txid, fee paid)
+		rng = self.rng
+		if coinbase:
+			spent = [(b'\x00' * 32, 0xffffffff, 0)]
+			total = (5000000000 >> (self.height // 210000)) + fees
+			scriptSig = struct.pack('<BI', 4, self.height) #Height push keeps every coinbase txid unique
+		else:
+			count = min(self.between("inputs"), len(self.unspent))
+			spent = [self.unspent.pop(rng.randrange(len(self.unspent))) for i in range(count)]
+			total = sum(value for txid, vout, value in spent)
+			scriptSig = None
+
+		inputs = varint(len(spent))
+		for txid, vout, value in spent:
+			sig = scriptSig if scriptSig is not None else self.script()
+			inputs += txid + struct.pack('<I', vout) + varint(len(sig)) + sig + b'\xff\xff\xff\xff'
+
+		outputCount = self.between("outputs")
+		fee = 0 if coinbase else min(total, rng.randint(0, 10000))
+		values = [(total - fee) // outputCount] * outputCount
+		values[0] += (total - fee) - sum(values)
+		outputs = varint(outputCount)
+		for value in values:
+			script = self.script()
+			outputs += struct.pack('<Q', value) + varint(len(script)) + script
+
+		body = inputs + outputs
+		lockTime = b'\x00\x00\x00\x00'
+		txid = doubleSha256(struct.pack('<I', 1) + body + lockTime)
+		if not coinbase and rng.random() < self.config["segwit"]:
+			witness = b''
+			for i in range(len(spent)):
+				items = self.between("witnessItems")
+				witness += varint(items)
+				for j in range(items):
+					item = self.randomBytes("witnessSize")
+					witness += varint(len(item)) + item
+			raw = struct.pack('<I', 1) + b'\x00\x01' + body + witness + lockTime
+		else:
+			raw = struct.pack('<I', 1) + body + lockTime
+		for vout, value in enumerate(values):
+			self.unspent.append((txid, vout, value))
+		return raw, txid, fee
+
+	def block(self): #Serialized block including the magic number and size prefix
+		transactions = []
+		fees = 0
+		for i in range(self.between("txPerBlock") - 1):
+			if not self.unspent:
+				break
+			raw, txid, fee = self.transaction(False)
+			transactions.append((raw, txid))
+			fees += fee
+		coinbase = self.transaction(True, fees)
+		transactions.insert(0, coinbase[:2])
+
+		header = block_reader.BLOCK_HEADER.pack(1, self.previousHash, merkleRoot([txid for raw, txid in transactions]),
+			self.config["startTime"] + 600 * self.height, self.config["bits"], self.rng.getrandbits(32))
+		body = header + varint(len(transactions)) + b''.join(raw for raw, txid in transactions)
+		self.previousHash = doubleSha256(header)
+		self.height += 1
+		return block_reader.BLOCK_PREFIX.pack(block_reader.MAGIC_NO, len(body)) + body
+
+def writeBlockFiles(outputDir, config = None): #Returns the blk file paths written
+	chain = SyntheticChain(config)
+	if not os.path.isdir(outputDir):
+		os.makedirs(outputDir)
+
+	paths = []
+	f = None
+	for i in range(chain.config["blocks"]):
+		if f is None or f.tell() >= chain.config["fileSize"]:
+			if f is not None:
+				f.write(b'\x00' * chain.config["padding"])
+				f.close()
+			paths.append(os.path.join(outputDir, "blk%05d.dat" % len(paths)))
+			f = open(paths[-1], 'wb')
+		f.write(chain.block())
+	if f is not None:
+		f.write(b'\x00' * chain.config["padding"])
+		f.close()
+	return paths
+
+def writeTextFiles(blockfiles, outputDir): #transactions0.txt and pubKey0.txt in the pre-extracted format, from the blk files
+	with open(os.path.join(outputDir, "transactions0.txt"), 'w') as t, open(os.path.join(outputDir, "pubKey0.txt"), 'w') as p:
+		for tx in tx_decoder.iterTransactions(blockfiles):
+			t.write("%d\n" % tx.value())
+			for output in tx.outputs():
+				p.write(output.scriptPubKey.hex() + "\n")
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} outputdir [blocks] [segwit share] [padding]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		config = {}
+		if len(sys.argv) > 2:
+			config["blocks"] = int(sys.argv[2])
+		if len(sys.argv) > 3:
+			config["segwit"] = float(sys.argv[3])
+		if len(sys.argv) > 4:
+			config["padding"] = int(sys.argv[4])
+		paths = writeBlockFiles(sys.argv[1], config)
+		print("Wrote %d blocks to %s" % (config.get("blocks", DEFAULT_CONFIG["blocks"]), ", ".join(paths)))
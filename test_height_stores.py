@@ -0,0 +1,79 @@
+import copy
+import os
+import random
+
+import numpy as np
+
+import chain_index
+import difficulty
+import prefix_index
+import rewards
+import synthetic_blocks
+
+############################################################################################################
+################################################ HELPERS ###################################################
+#Every store is updated block by block as a node would write them (a reorg, a block cut short) and then
+#compared with stores built in one go from the final files.
+
+CONFIG = {"txPerBlock": (1, 5), "seed": 7}
+
+def writeBlocks(path, chain, count):
+	with open(path, 'ab') as f:
+		for i in range(count):
+			f.write(chain.block())
+
+def updateStores(dataDir, storeDir):
+	blockfiles = [os.path.join(dataDir, "blk00000.dat")]
+	index = prefix_index.PrefixIndex(os.path.join(storeDir, "prefix"))
+	index.update(blockfiles)
+	series = difficulty.DifficultySeries(os.path.join(storeDir, "difficulty"))
+	series.update(chain_index.loadChain(blockfiles))
+	rewardSeries = rewards.RewardSeries(os.path.join(storeDir, "rewards"))
+	rewardSeries.update(blockfiles)
+	return index, series, rewardSeries
+
+def assertSameStores(stores, expected):
+	for store, fresh in zip(stores, expected):
+		assert len(store) == len(fresh)
+		assert np.array_equal(store.keys, fresh.keys)
+		for name in fresh.columns:
+			if fresh[name].dtype.kind == 'f': #Running work totals are summed in another order
+				assert np.allclose(store[name], fresh[name], rtol = 1e-12), name
+			else:
+				assert np.array_equal(store[name], fresh[name]), name
+
+############################################################################################################
+################################################ TESTS #####################################################
+
+def test_reorg_and_partial_block_match_a_fresh_build(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path) #chain/ and headers/ are relative to the working directory
+	os.makedirs("data")
+	mainBranch = synthetic_blocks.SyntheticChain(CONFIG)
+	writeBlocks("data/blk00000.dat", mainBranch, 20)
+	fork = copy.deepcopy(mainBranch)
+	fork.rng = random.Random(99) #Same parent, different blocks from here on
+	writeBlocks("data/blk00000.dat", mainBranch, 10)
+	stores = updateStores("data", "incremental")
+	assert len(stores[0]) == 30
+	mainKeys = np.array(stores[0].keys)
+
+	raw = fork.block()
+	with open("data/blk00000.dat", 'ab') as f: #First fork block still being written
+		f.write(raw[:len(raw) // 2])
+	assert len(updateStores("data", "incremental")[0]) == 30
+	with open("data/blk00000.dat", 'ab') as f:
+		f.write(raw[len(raw) // 2:])
+	writeBlocks("data/blk00001.dat", fork, 14) #The fork overtakes the main branch at height 35
+
+	stores = updateStores("data", "incremental")
+	assert len(stores[0]) == 35
+	assert np.array_equal(stores[0].keys[:20], mainKeys[:20]) #Cut back to the fork point, not rebuilt
+	assert not np.any(stores[0].keys[20:30] == mainKeys[20:30])
+
+	for directory in ("chain", "headers"):
+		for name in os.listdir(directory):
+			os.remove(os.path.join(directory, name))
+	for name in os.listdir("data"):
+		if name.endswith(".idx"):
+			os.remove(os.path.join("data", name))
+	assertSameStores(stores, updateStores("data", "fresh"))
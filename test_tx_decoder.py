@@ -0,0 +1,65 @@
+import block_reader
+import synthetic_blocks
+import tx_decoder
+import txid_index
+
+############################################################################################################
+################################################ HELPERS ###################################################
+#Half of the ordinary transactions are written with witness data. A block's merkle root only matches when every
+#transaction is stepped over to the right end and its txid leaves the marker, flag and witnesses out.
+
+CONFIG = {"blocks": 40, "txPerBlock": (1, 30), "segwit": 0.5, "seed": 13}
+
+def iterBlockTransactions(tmp_path): #Yields (BlockRecord, [TxRecord, ...]) for each block in file order
+	for blockfile in synthetic_blocks.writeBlockFiles(str(tmp_path), CONFIG):
+		with block_reader.BlockFile(blockfile) as bf:
+			for height, record in enumerate(bf.iterBlocks()):
+				yield record, list(tx_decoder.iterBlockTransactions(bf.buffer, record, height))
+
+def witnessBytes(tx): #Marker, flag and each input's stack counted from the item sizes
+	size = 2
+	for sizes in tx.witnessItemSizes():
+		size += len(synthetic_blocks.varint(len(sizes)))
+		size += sum(len(synthetic_blocks.varint(itemSize)) + itemSize for itemSize in sizes)
+	return size
+
+############################################################################################################
+################################################ TESTS #####################################################
+
+def test_txids_give_the_header_merkle_root_and_transactions_stay_inside_their_block(tmp_path):
+	blocks = 0
+	for record, transactions in iterBlockTransactions(tmp_path):
+		blocks += 1
+		assert len(transactions) == record.transaction_count
+		txids = [txid_index.txid(tx) for tx in transactions]
+		assert synthetic_blocks.merkleRoot(txids) == record.blockheader.merkleHash[::-1] #read_header_at reverses it
+
+		start = record.offset + block_reader.BLOCK_PREFIX.size + block_reader.HEADER_SIZE
+		end = record.offset + block_reader.BLOCK_PREFIX.size + record.blocksize
+		for tx in transactions:
+			assert start < tx.offset < tx.endOffset <= end
+		assert transactions[-1].endOffset == end
+	assert blocks == CONFIG["blocks"]
+
+def test_witness_sizes_weight_and_vsize(tmp_path):
+	witness = legacy = 0
+	for record, transactions in iterBlockTransactions(tmp_path):
+		assert not transactions[0].hasWitness #Coinbases are written without witness data
+		for tx in transactions:
+			buf = tx.buffer
+			if tx.hasWitness:
+				witness += 1
+				assert bytes(buf[tx.offset + 4:tx.offset + 6]) == b'\x00\x01'
+				assert tx.witnessSize() == witnessBytes(tx)
+				stripped = bytes(buf[tx.offset:tx.offset + 4]) + bytes(buf[tx.bodyOffset:tx.witnessOffset]) + bytes(buf[tx.endOffset - 4:tx.endOffset])
+				assert tx.baseSize() == len(stripped)
+				assert txid_index.txid(tx) == synthetic_blocks.doubleSha256(stripped)
+			else:
+				legacy += 1
+				assert tx.witnessSize() == 0
+				assert tx.baseSize() == tx.totalSize()
+				assert txid_index.txid(tx) == synthetic_blocks.doubleSha256(bytes(buf[tx.offset:tx.endOffset]))
+			assert tx.weight() == tx.baseSize() * 4 + tx.witnessSize()
+			assert tx.vsize() == -(-tx.weight() // 4)
+			assert tx.vsize() < tx.totalSize() if tx.hasWitness else tx.vsize() == tx.totalSize()
+	assert witness > 0 and legacy > CONFIG["blocks"]
@@ -0,0 +1,84 @@
+import os
+from array import array
+
+import numpy as np
+
+import atomic_files
+import chain_index
+import tx_decoder
+
+############################################################################################################
+################################################ ROLLUPS ###################################################
+#Per-block metrics bucketed by the UTC time in BlockHeader.time. Hours are summed from the blocks,
+#days from the hours and months from the days, each level kept as rollups/<granularity>.npy
+
+ROLLUP_DIR = "rollups"
+GRANULARITIES = ("hour", "day", "month")
+METRICS = ("blocks", "txCount", "outputValue", "blockSize", "reward")
+ROLLUP_DTYPE = np.dtype([("time", '<i8')] + [(metric, '<i8') for metric in METRICS]) #time = start of the bucket, unix seconds
+
+def blockMetrics(blockfiles): #One pass over the best chain collecting time and metrics of every block as columns
+	columns = dict((name, array('q')) for name in ("time",) + METRICS)
+	for blockfile, buf, record, height in chain_index.iterChainBlocks(blockfiles):
+		reward = 0
+		outputValue = 0
+		for tx in tx_decoder.iterBlockTransactions(buf, record, height):
+			value = tx.value()
+			if tx.txIndex == 0: #Coinbase pays out subsidy plus fees
+				reward = value
+			outputValue += value
+		columns["time"].append(record.blockheader.time)
+		columns["blocks"].append(1)
+		columns["txCount"].append(record.transaction_count)
+		columns["outputValue"].append(outputValue)
+		columns["blockSize"].append(record.blocksize)
+		columns["reward"].append(reward)
+	return dict((name, np.frombuffer(column, dtype = np.int64)) for name, column in columns.items())
+
+def rollup(keys, columns, bucketStarts): #Sums every metric per distinct key, keys map rows to buckets
+	uniqueKeys, rows = np.unique(keys, return_inverse = True)
+	table = np.zeros(len(uniqueKeys), dtype = ROLLUP_DTYPE)
+	table["time"] = bucketStarts(uniqueKeys)
+	for metric in METRICS:
+		np.add.at(table[metric], rows, columns[metric]) #Integer sums, float weights would lose satoshis
+	return table
+
+def buildRollups(blockfiles, rollupDir = ROLLUP_DIR):
+	blocks = blockMetrics(blockfiles)
+	hours = rollup(blocks["time"] // 3600, blocks, lambda keys: keys * 3600)
+	days = rollup(hours["time"] // 86400, hours, lambda keys: keys * 86400)
+	dayMonths = (days["time"] // 86400).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+	months = rollup(dayMonths, days, lambda keys: keys.astype('datetime64[M]').astype('datetime64[s]').astype(np.int64))
+
+	if not os.path.isdir(rollupDir):
+		os.makedirs(rollupDir)
+	tables = {"hour": hours, "day": days, "month": months}
+	for granularity, table in tables.items():
+		atomic_files.saveArray(os.path.join(rollupDir, granularity + ".npy"), table)
+	return tables
+
+def loadRollups(rollupDir = ROLLUP_DIR):
+	tables = {}
+	for granularity in GRANULARITIES:
+		path = os.path.join(rollupDir, granularity + ".npy")
+		if os.path.exists(path):
+			tables[granularity] = np.load(path, mmap_mode = 'r')
+	return tables
+
+def timeseries(table, metric, start = None, end = None): #{"time": [...], "values": [...]} for buckets starting in [start, end)
+	times = table["time"]
+	first = 0 if start is None else int(np.searchsorted(times, start, side = 'left'))
+	last = len(times) if end is None else int(np.searchsorted(times, end, side = 'left'))
+	return {"time": times[first:last].tolist(), "values": table[metric][first:last].tolist()}
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		tables = buildRollups(sys.argv[1:])
+		print(", ".join("%d %ss" % (len(tables[g]), g) for g in GRANULARITIES))
@@ -0,0 +1,114 @@
+import heapq
+from collections import namedtuple
+
+import numpy as np
+
+import block_index
+import block_reader
+import instrumentation
+import tx_decoder
+
+############################################################################################################
+################################################ TOP K #####################################################
+#Every source ranks transactions by their total output value, the number transactions0.txt holds. height is
+#the real block height, or -1 when the source only knows row numbers (txIndex is then the row).
+#txIndex/outputIndex are -1 and script None when the source doesn't have them; outputIndex and script
+#belong to the transaction's largest output.
+
+TopEntry = namedtuple("TopEntry", ["value", "height", "txIndex", "outputIndex", "script"])
+
+class TopK(object): #Keeps the k largest values seen in a min-heap, O(n log k) time and O(k) memory
+
+	def __init__(self, k):
+		self.k = k
+		self.heap = []
+		self.seen = 0 #Tie breaker so equal values never compare entries, earlier entries win ties
+
+	def accepts(self, value): #Cheap check before building an entry
+		return len(self.heap) < self.k or value > self.heap[0][0]
+
+	def push(self, entry):
+		self.seen += 1
+		item = (entry.value, -self.seen, entry)
+		if len(self.heap) < self.k:
+			heapq.heappush(self.heap, item)
+		elif item > self.heap[0]:
+			heapq.heapreplace(self.heap, item)
+
+	def merge(self, other): #Combines partial top-Ks from chunks or workers
+		for entry in other.entries():
+			if self.accepts(entry.value):
+				self.push(entry)
+		return self
+
+	def entries(self): #Largest value first
+		return [item[2] for item in sorted(self.heap, reverse = True)]
+
+############################################################################################################
+################################################ SOURCES ###################################################
+
+def transactionEntry(tx, value): #Entry for a decoded transaction, its scripts are only copied once it makes the list
+	outputIndex, output = max(enumerate(tx.outputs()), key = lambda item: item[1].value, default = (-1, None))
+	return TopEntry(value, tx.height, tx.txIndex, outputIndex, output.scriptPubKey if output is not None else None)
+
+def topTransactions(blockfiles, k): #Most valuable transactions of the best chain with their real block and position
+	top = TopK(k)
+	for tx in tx_decoder.iterTransactions(blockfiles):
+		value = tx.value()
+		if top.accepts(value):
+			top.push(transactionEntry(tx, value))
+	return top
+
+def topTransactionsInRange(chain, k, start = 0, stop = None): #Same ranking over heights start..stop-1 of a chain index, only those blocks are read
+	top = TopK(k)
+	for height, (buf, record) in enumerate(chain.iter_mapped_blocks(start, stop), start):
+		for tx in tx_decoder.iterBlockTransactions(buf, record, height):
+			value = tx.value()
+			if top.accepts(value):
+				top.push(transactionEntry(tx, value))
+	return top
+
+def topFromValues(values, k): #Any iterable of values without blocks, e.g. transactions0.txt, the position is kept as the row
+	top = TopK(k)
+	for row, value in enumerate(values):
+		if top.accepts(value):
+			top.push(TopEntry(int(value), -1, row, -1, None))
+	return top
+
+def topFromArrays(values, heights, k, chunkSize = 1 << 20): #Partial selection with argpartition per chunk, chunks merged through the heap
+	#heights in chain order give each row its block and position in it, None keeps rows like topFromValues
+	top = TopK(k)
+	for start in range(0, len(values), chunkSize):
+		chunk = np.asarray(values[start:start + chunkSize])
+		if len(chunk) > k:
+			best = np.argpartition(chunk, len(chunk) - k)[len(chunk) - k:]
+		else:
+			best = np.arange(len(chunk))
+		for i in np.sort(best): #Row order keeps ties deterministic
+			if not top.accepts(chunk[i]):
+				continue
+			row = start + int(i)
+			if heights is None:
+				top.push(TopEntry(int(chunk[i]), -1, row, -1, None))
+			else:
+				height = int(heights[row])
+				top.push(TopEntry(int(chunk[i]), height, row - int(np.searchsorted(heights, height)), -1, None))
+		instrumentation.progress(start + len(chunk), len(values), "rows")
+	return top
+
+def withOutputs(top, chain): #Same top-K with the largest output filled in for entries that only know their block and position, from a chain index
+	#One block is decoded per entry. An entry whose height now holds another block (the transaction there has another value) is kept as it is
+	byNumber = dict((block_index.blockFileNumber(blockfile), blockfile) for blockfile in chain.blockfiles)
+	filled = TopK(top.k)
+	for entry in top.entries(): #Pushed largest first, so ties keep their order
+		if entry.script is None and 0 <= entry.height < len(chain) and entry.txIndex >= 0:
+			row = int(chain["mainRows"][entry.height])
+			with block_reader.BlockFile(byNumber[int(chain.table["fileNumber"][row])]) as bf:
+				record = block_reader.read_block_at(bf.buffer, int(chain.table["offset"][row]))
+				for tx in tx_decoder.iterBlockTransactions(bf.buffer, record, entry.height):
+					if tx.txIndex == entry.txIndex:
+						if tx.value() == entry.value:
+							entry = transactionEntry(tx, entry.value)
+						break
+		filled.push(entry)
+	return filled
@@ -7,18 +7,40 @@ from bokeh.models.glyphs import VBar
 from bokeh.plotting import figure
 from bokeh.embed import components
 from bokeh.models.sources import ColumnDataSource
-from flask import Flask, render_template
+from flask import Flask, render_template, abort
+import chain_index
+import columnar_store
+import ingest
+import window_aggregates
+import chart_cache
+import utxo_set
+import background_jobs
+import instrumentation
 
 ############################################################################################################
 ################################################ FUNCTIONS #################################################
 transactionAmountDict = {"Block": [], "Value": []} #Dict used to hold graph data
-updateData = []
-numBlocksPerHundred = []
+blockValues = None #ReloadedData of (satoshis per row, "blocks" or "transactions"), kept so any window size can be charted
+WINDOW_SIZE = 20000
 
+@instrumentation.timed("transaction_counter.parseBlockFile")
 def parseBlockFile(blockfile):
 	block = Block()
 	block.parseBlockFile(blockfile)
 
+def loadScanResults(results): #Same chart data from a scan_engine pass instead of parsing again
+	global blockValues
+	values = results["blockValues"]
+	blockValues = chart_cache.ReloadedData(lambda: (values, "blocks"), []) #No files behind it, loaded once
+	windowData = valueChartData(values, WINDOW_SIZE)
+	transactionAmountDict["Block"] = windowData["Block"]
+	transactionAmountDict["Value"] = windowData["Value"]
+
+def valueChartData(values, window_size): #Window totals summed in satoshis, charted in BTC
+	chartData = window_aggregates.windowChartData(values, window_size, "Block", "Value")
+	chartData["Value"] = [value/100000000.00 for value in chartData["Value"]]
+	return chartData
+
 def read_1bit(stream):
 	return ord(stream.read(1))
 
@@ -52,23 +74,36 @@ def read_varint(stream):
 	return -1
 
 def get_hexstring(bytebuffer):
-	return(''.join(('%x' %i for i in bytebuffer)))
+	return(''.join(('%02x' %i for i in bytebuffer)))
 
 ############################################################################################################
 ################################################ BOOKEH FUNCTIONS ##########################################
 
-def create_hover_tool(): #Hover tool for barchart
+def create_hover_tool(window_size = WINDOW_SIZE, rows = "blocks"): #Hover tool for barchart
 	hover_html = """
 		<div>
-			<span class = "hover_tooltip">Value of $x * 20,000 transactions</span>
+			<span class = "hover_tooltip">Value of $x * {:,} {}</span>
 		</div>
 		<div>
 			<span class = "hover_tooltip">@Value (BTC)</span>
 		</div>
+	""".format(window_size, rows)
+	return HoverTool(tooltips = hover_html)
+
+def create_utxo_hover_tool(): #Hover tool for the UTXO set chart
+	hover_html = """
+		<div>
+			<span class = "hover_tooltip">After block @Block</span>
+		</div>
+		<div>
+			<span class = "hover_tooltip">@Count unspent outputs worth @Value (BTC)</span>
+		</div>
 	"""
 	return HoverTool(tooltips = hover_html)
 
-def create_bar_chart(transactionAmountDict, title, x_name, y_name, hover_tool = None, width = 1200, height = 300):
+@instrumentation.timed("bokeh.create_bar_chart")
+def create_bar_chart(transactionAmountDict, title, x_name, y_name, hover_tool = None, width = 1200, height = 300,
+	y_label = "Transacted amount (BTC)", x_label = "Block Number Range"):
 	source = ColumnDataSource(transactionAmountDict)
 	xdr = FactorRange(factors = transactionAmountDict[x_name])
 	ydr = Range1d(start = 0, end = max(transactionAmountDict[y_name])*1.1)
@@ -94,31 +129,63 @@ def create_bar_chart(transactionAmountDict, title, x_name, y_name, hover_tool =
 	plot.min_border_top = 0
 	plot.xgrid.grid_line_color = None
 	plot.ygrid.grid_line_color = "#999999"
-	plot.yaxis.axis_label = "Transacted amount (BTC)"
+	plot.yaxis.axis_label = y_label
 	plot.ygrid.grid_line_alpha = 0.1
-	plot.xaxis.axis_label = "Block Number Range (Range size = 20,000)"
+	plot.xaxis.axis_label = x_label
 	plot.xaxis.major_label_orientation = 1
 	return plot
 
+@instrumentation.timed("transaction_counter.create_chart")
+def create_chart(window_size = WINDOW_SIZE, blocks_count = None): #Builds the plot without needing a request, used by the route and build_charts
+	values, rows = blockValues.get()
+	chartData = valueChartData(values[:blocks_count], window_size)
+	hover = create_hover_tool(window_size, rows)
+	return create_bar_chart(chartData, "Transacted amount per {:,} {}".format(window_size, rows), "Block", "Value", hover,
+		x_label = "{} Number Range (Range size = {:,})".format(rows[:-1].capitalize(), window_size))
+
 app = Flask(__name__)
+chartCache = chart_cache.ChartCache(columnar_store.sourceFiles() + [utxo_set.UTXO_SERIES] + ingest.discoverBlockFiles()) #Rendered charts per route and parameters
+precompute = background_jobs.BackgroundJob(app) #Parsing runs after the server is up, GET /status shows how far it got
+instrumentation.register(app, chartCache) #GET /metrics in Prometheus text format
 
-@app.route("/<int:blocks_count>/")
+@app.route("/<int:blocks_count>/", defaults = {"window_size": WINDOW_SIZE})
+@app.route("/<int:blocks_count>/<int:window_size>/")
+@precompute.required
+@chartCache.cached
 
-def chart(blocks_count):
+def chart(blocks_count, window_size):
 	if blocks_count <= 0:
 		blocks_count = 1
+	if window_size <= 0:
+		abort(400)
 
-	for i in range(1, blocks_count):
-		transactionAmountDict["Block"].append(i)
-		transactionAmountDict["Value"].append(i)
+	plot = create_chart(window_size, blocks_count) #Only the first blocks_count blocks are charted
 
-	hover = create_hover_tool()
-	plot = create_bar_chart(transactionAmountDict, "Number of transactions per 50 blocks", "Block", "Value", hover)
-
-	script, div = components(plot)
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
 
 	return render_template("chart_03.html", blocks_count = blocks_count, the_div = div, the_script = script)
 
+@app.route("/utxo/", defaults = {"metric": "count"})
+@app.route("/utxo/<metric>/")
+@chartCache.cached
+
+def utxo_chart(metric): #UTXO set size or value every N blocks, built beforehand by utxo_set.py
+	series = utxo_set.loadSeries()
+	if series is None or metric not in ("count", "value"):
+		abort(404)
+
+	hover = create_utxo_hover_tool()
+	if metric == "count":
+		plot = create_bar_chart(series, "Size of the UTXO set", "Block", "Count", hover, y_label = "Unspent outputs", x_label = "Block Number")
+	else:
+		plot = create_bar_chart(series, "Value held in the UTXO set", "Block", "Value", hover, y_label = "Unspent value (BTC)", x_label = "Block Number")
+
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
+
+	return render_template("chart_03.html", blocks_count = len(series["Block"]), the_div = div, the_script = script)
+
 ############################################################################################################
 ############################################### BLOCK READER ###############################################
 
@@ -134,30 +201,12 @@ class Block(object):
 
 	def parseBlockFile(self, blockfile):
 
-		blockNumber = 0 
-		numTransactionsPerHundred = []
-
-		with open('transactions0.txt', 'r') as t: #Opens and reads stored transaction info
-			transactionVals = [line.strip() for line in t] #Adds read data to list
-
-		for i in transactionVals: #Loop for summing transaction info
-			addNum = int(i)
-			numTransactionsPerHundred.append(addNum)
-			transactionAmountDict["Block"].append(blockNumber)
-			blockNumber += 1
-
-		j = 0
-		k = 20000
-		theCount = 1
-		for i in range(0, len(numTransactionsPerHundred), 20000): #Loop creates chunks for data to be used
-			value1 = sum((numTransactionsPerHundred)[j:k])
-			updateData.append(value1)
-			numBlocksPerHundred.append(theCount)
-			k += 20000
-			theCount += 1
+		global blockValues #Per-transaction sources are summed per block first, read again once a source changes
+		blockValues = chart_cache.ReloadedData(lambda: (columnar_store.loadBlockValues(blockfile, chain = chain_index.loadSavedChain()), columnar_store.blockValueRows()), columnar_store.sourceFiles())
 
-		transactionAmountDict["Block"] = numBlocksPerHundred
-		transactionAmountDict["Value"] = updateData
+		windowData = valueChartData(blockValues.get()[0], WINDOW_SIZE) #Sums each chunk of 20,000 blocks in one pass
+		transactionAmountDict["Block"] = windowData["Block"]
+		transactionAmountDict["Value"] = windowData["Value"]
 
 ############################################################################################################
 ############################################### BLOCK HEADER ###############################################
@@ -277,5 +326,5 @@ if __name__ == "__main__":
 	if len(sys.argv) < 1:
 		print(usage.format(sys.argv[0]))
 	else: 
-		parseBlockFile("blk00000.dat") #Initial file to be parsed
+		precompute.start([("parse", lambda: parseBlockFile("blk00000.dat"))], reloader = True) #Initial file to be parsed, in the reloader's serving process
 	app.run(debug = True)
\ No newline at end of file
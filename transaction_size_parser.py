@@ -7,17 +7,44 @@ from bokeh.models.glyphs import VBar
 from bokeh.plotting import figure
 from bokeh.embed import components
 from bokeh.models.sources import ColumnDataSource
-from flask import Flask, render_template
+from flask import Flask, render_template, abort, jsonify, request
+import chain_index
+import window_aggregates
+import prefix_index
+import chart_cache
+import ingest
+import time_rollups
+import difficulty
+import background_jobs
+import instrumentation
 
 ############################################################################################################
 ################################################ PYTHON FUNCTIONS ##########################################
 data = {"Block": [], "Transactions": []} #Dict used to hold graph data
-updateData = []
-numBlocksPerHundred = []
+WINDOW_SIZE = 1000
 
-def parseBlockFile(blockfile):
+def loadBlockTransactions(): #Transaction count of every block of the saved chain, kept so any window size can be charted
+	chain = chain_index.loadSavedChain()
+	return chain.mainColumn("txCount") if chain is not None else []
+
+#Read again whenever their files change, an Ingestor in another process extends them
+blockTransactions = chart_cache.ReloadedData(loadBlockTransactions, [chain_index.CHAIN_META]) #Header scan saved by the chain stage
+prefixIndex = chart_cache.ReloadedData(prefix_index.PrefixIndex, [os.path.join(prefix_index.PREFIX_DIR, name + ".npy") for name in prefix_index.METRICS + ("blockKeys",)]) #Running totals on disk for block range queries
+rollupTables = chart_cache.ReloadedData(time_rollups.loadRollups, [os.path.join(time_rollups.ROLLUP_DIR, granularity + ".npy") for granularity in time_rollups.GRANULARITIES]) #Hourly/daily/monthly tables, built beforehand by time_rollups.py
+difficultySeries = chart_cache.ReloadedData(difficulty.DifficultySeries, [os.path.join(difficulty.DIFFICULTY_DIR, name + ".npy") for name in difficulty.COLUMNS + ("blockKeys",)]) #Difficulty and block work per height, extended as headers come in
+
+@instrumentation.timed("transaction_size_parser.parseBlockFile")
+def parseBlockFile(blockfile, workers = None): #workers > 0 scans the block headers in parallel processes
 	block = Block()
-	block.parseBlockFile(blockfile)
+	block.parseBlockFile(blockfile, workers)
+
+def loadScanResults(results): #Same chart data from a scan_engine pass instead of parsing again
+	global blockTransactions
+	txCounts = results["txCount"]
+	blockTransactions = chart_cache.ReloadedData(lambda: txCounts, []) #No files behind it, loaded once
+	windowData = window_aggregates.windowChartData(txCounts, WINDOW_SIZE, "Block", "Transactions")
+	data["Block"] = windowData["Block"]
+	data["Transactions"] = windowData["Transactions"]
 
 def read_1bit(stream):
 	return ord(stream.read(1))
@@ -52,7 +79,7 @@ def read_varint(stream): #Function for variable integers e.g. transaction size
 	return -1
 
 def get_hexstring(bytebuffer): #Function for returning hashes
-	return(''.join(('%x' %i for i in bytebuffer)))
+	return(''.join(('%02x' %i for i in bytebuffer)))
 
 ############################################################################################################
 ################################################ BOOKEH FUNCTIONS ##########################################
@@ -68,7 +95,20 @@ def create_hover_tool(): #Hover tool for barchart
 	"""
 	return HoverTool(tooltips = hover_html)
 
-def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 1200, height = 300): #Function for creating barchart
+def create_difficulty_hover_tool(y_name, unit): #Hover tool for the difficulty and hashrate charts
+	hover_html = """
+		<div>
+			<span class = "hover_tooltip">Block Range: $x</span>
+		</div>
+		<div>
+			<span class = "hover_tooltip">@%s %s</span>
+		</div>
+	""" % (y_name, unit)
+	return HoverTool(tooltips = hover_html)
+
+@instrumentation.timed("bokeh.create_bar_chart")
+def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 1200, height = 300,
+	y_label = "Number of Transactions", x_label = "Block Number"): #Function for creating barchart
 	source = ColumnDataSource(data)
 	xdr = FactorRange(factors = data[x_name])
 	ydr = Range1d(start = 0, end = max(data[y_name])*1.3)
@@ -94,31 +134,112 @@ def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 120
 	plot.min_border_top = 0
 	plot.xgrid.grid_line_color = None
 	plot.ygrid.grid_line_color = "#999999"
-	plot.yaxis.axis_label = "Number of Transactions"
+	plot.yaxis.axis_label = y_label
 	plot.ygrid.grid_line_alpha = 0.1
-	plot.xaxis.axis_label = "Block Number"
+	plot.xaxis.axis_label = x_label
 	plot.xaxis.major_label_orientation = 1
 	return plot
 
+@instrumentation.timed("transaction_size_parser.create_chart")
+def create_chart(window_size = WINDOW_SIZE, blocks_count = None): #Builds the plot without needing a request, used by the route and build_charts
+	chartData = window_aggregates.windowChartData(blockTransactions.get()[:blocks_count], window_size, "Block", "Transactions")
+	hover = create_hover_tool()
+	return create_bar_chart(chartData, "Number of transactions per {:,} blocks".format(window_size), "Block", "Transactions", hover)
+
+@instrumentation.timed("transaction_size_parser.create_difficulty_chart")
+def create_difficulty_chart(metric, window_size = difficulty.RETARGET_INTERVAL): #Mean difficulty or average hashrate (TH/s) per window of heights
+	series = difficultySeries.get()
+	if metric == "difficulty":
+		chartData = window_aggregates.windowChartData(series["difficulty"], window_size, "Block", "Difficulty", stat = "means")
+		hover = create_difficulty_hover_tool("Difficulty", "")
+		return create_bar_chart(chartData, "Mean difficulty per %d blocks" % window_size, "Block", "Difficulty", hover, y_label = "Difficulty")
+	hashrate = series.windowHashrate(window_size) / 1e12
+	chartData = {"Block": list(range(1, len(hashrate) + 1)), "Hashrate": hashrate.tolist()}
+	hover = create_difficulty_hover_tool("Hashrate", "TH/s")
+	return create_bar_chart(chartData, "Estimated hashrate per %d blocks" % window_size, "Block", "Hashrate", hover, y_label = "Hashrate (TH/s)")
+
 app = Flask(__name__)
+chartCache = chart_cache.ChartCache(ingest.discoverBlockFiles() + ["prefix/checkpoint.json"] + blockTransactions.dataFiles) #Rendered charts per route and parameters
+precompute = background_jobs.BackgroundJob(app) #Parsing runs after the server is up, GET /status shows how far it got
+instrumentation.register(app, chartCache) #GET /metrics in Prometheus text format
 
-@app.route("/<int:blocks_count>/")
+@app.route("/<int:blocks_count>/", defaults = {"window_size": WINDOW_SIZE})
+@app.route("/<int:blocks_count>/<int:window_size>/")
+@precompute.required
+@chartCache.cached
 
-def chart(blocks_count):
+def chart(blocks_count, window_size):
 	if blocks_count <= 0:
 		blocks_count = 1
+	if window_size <= 0:
+		abort(400)
 
-	for i in range(1, blocks_count):
-		data["Block"].append(i)
-		data["Transactions"].append(i)
+	plot = create_chart(window_size, blocks_count) #Only the first blocks_count blocks are charted
 
-	hover = create_hover_tool()
-	plot = create_bar_chart(data, "Number of transactions per 50 blocks", "Block", "Transactions", hover)
-
-	script, div = components(plot)
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
 
 	return render_template("chart.html", blocks_count = blocks_count, the_div = div, the_script = script)
 
+@app.route("/difficulty/<metric>/", defaults = {"window_size": difficulty.RETARGET_INTERVAL})
+@app.route("/difficulty/<metric>/<int:window_size>/")
+@precompute.required
+@chartCache.cached
+
+def difficulty_chart(metric, window_size): #metric is difficulty or hashrate
+	if metric not in ("difficulty", "hashrate") or len(difficultySeries.get()) == 0:
+		abort(404)
+	if window_size <= 0:
+		abort(400)
+
+	plot = create_difficulty_chart(metric, window_size)
+
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
+
+	return render_template("chart.html", blocks_count = len(difficultySeries.get()), the_div = div, the_script = script)
+
+@app.route("/retargets/")
+@precompute.required
+
+def retargets(): #Every adjustment height with its difficulty and the change from the period before
+	return jsonify(difficultySeries.get().retargets())
+
+@app.route("/hashrate/")
+@precompute.required
+
+def rolling_hashrate(): #Hashrate (H/s) over the ?window= blocks ending at each height, one height in every ?step= (the window by default)
+	window = request.args.get("window", difficulty.HASHRATE_WINDOW, type = int)
+	step = request.args.get("step", window, type = int)
+	if window <= 0 or step <= 0:
+		abort(400)
+
+	series = difficultySeries.get()
+	hashrate = series.hashrate(window)[::step]
+	return jsonify({"window": window, "height": list(range(window, len(series), step)), "hashrate": hashrate.tolist()})
+
+@app.route("/range/<int:start>/<int:end>/")
+@precompute.required
+
+def block_range(start, end): #Transactions, BTC moved and bytes between two block numbers (inclusive)
+	index = prefixIndex.get()
+	if start > end or end >= len(index):
+		abort(404)
+
+	return jsonify(index.rangeTotals(start, end))
+
+@app.route("/timeseries/<metric>/<granularity>/")
+
+def timeseries(metric, granularity): #Precomputed totals per UTC hour/day/month, ?start=&end= in unix seconds
+	tables = rollupTables.get()
+	if metric not in time_rollups.METRICS or granularity not in tables:
+		abort(404)
+
+	series = time_rollups.timeseries(tables[granularity], metric, request.args.get("start", type = int), request.args.get("end", type = int))
+	series["metric"] = metric
+	series["granularity"] = granularity
+	return jsonify(series)
+
 ############################################################################################################
 ############################################### BLOCK READER ###############################################
 
@@ -132,156 +253,23 @@ class Block(object):
 		transactions = None
 		blockfile = None
 
-	def parseBlockFile(self, blockfile): #Block parsing function for 140,000 blocks
-
-		blockNumber = 0
-		with open(blockfile, 'rb') as bf: #Parses first blockfile
-			countBytes = 0
-			blockFileSize = os.path.getsize(blockfile)
-
-			for i in range(0, blockFileSize, 223):
-				if countBytes == 0:	
-					data["Block"].append(blockNumber)
-					self.magic_no = read_4bit(bf)
-					self.blocksize = read_4bit(bf)
-					countBytes += self.blocksize + 8
-					self.blockheader = BlockHeader()
-					self.blockheader.parse(bf)
-					self.transaction_count = read_varint(bf)
-					data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				elif countBytes < blockFileSize:
-					with open(blockfile, 'rb') as newbf:
-						data["Block"].append(blockNumber)
-						newbf.seek(countBytes)
-						self.magic_no = read_4bit(newbf)
-						self.blocksize = read_4bit(newbf)
-						countBytes += self.blocksize + 8
-						self.blockheader = BlockHeader()
-						self.blockheader.parse(newbf)
-						self.transaction_count = read_varint(newbf)
-						data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				else:
-					bf.close()
-
-				blockNumber += 1
-
-		with open("blk00001.dat", 'rb') as bf: #Parses second file
-			countBytes = 0
-			blockFileSize = os.path.getsize("blk00001.dat")
-
-			for i in range(0, blockFileSize, 223):
-				if countBytes == 0:	
-					data["Block"].append(blockNumber)
-					self.magic_no = read_4bit(bf)
-					self.blocksize = read_4bit(bf)
-					countBytes += self.blocksize + 8
-					self.blockheader = BlockHeader()
-					self.blockheader.parse(bf)
-					self.transaction_count = read_varint(bf)
-					data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				elif countBytes < blockFileSize:
-					with open("blk00001.dat", 'rb') as newbf:
-						data["Block"].append(blockNumber)
-						newbf.seek(countBytes)
-						self.magic_no = read_4bit(newbf)
-						self.blocksize = read_4bit(newbf)
-						countBytes += self.blocksize + 8
-						self.blockheader = BlockHeader()
-						self.blockheader.parse(newbf)
-						self.transaction_count = read_varint(newbf)
-						data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				else:
-					bf.close()
-
-				blockNumber += 1
-
-		with open("blk00002.dat", 'rb') as bf: #Parses third blockfile
-			countBytes = 0
-			blockFileSize = os.path.getsize("blk00002.dat")
-
-			for i in range(0, blockFileSize, 223):
-				if countBytes == 0:	
-					data["Block"].append(blockNumber)
-					self.magic_no = read_4bit(bf)
-					self.blocksize = read_4bit(bf)
-					countBytes += self.blocksize + 8
-					self.blockheader = BlockHeader()
-					self.blockheader.parse(bf)
-					self.transaction_count = read_varint(bf)
-					data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				elif countBytes < blockFileSize:
-					with open("blk00002.dat", 'rb') as newbf:
-						data["Block"].append(blockNumber)
-						newbf.seek(countBytes)
-						self.magic_no = read_4bit(newbf)
-						self.blocksize = read_4bit(newbf)
-						countBytes += self.blocksize + 8
-						self.blockheader = BlockHeader()
-						self.blockheader.parse(newbf)
-						self.transaction_count = read_varint(newbf)
-						data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-				else:
-					bf.close()
-
-				blockNumber += 1
-
-		with open("blk00003.dat", 'rb') as bf: #Parses fourth blockfile
-			countBytes = 0
-			blockFileSize = os.path.getsize("blk00003.dat")
-
-			for i in range(0, blockFileSize, 223):
-				if countBytes == 0:	
-					data["Block"].append(blockNumber)
-					self.magic_no = read_4bit(bf)
-					self.blocksize = read_4bit(bf)
-					countBytes += self.blocksize + 8
-					self.blockheader = BlockHeader()
-					self.blockheader.parse(bf)
-					self.transaction_count = read_varint(bf)
-					data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				elif countBytes < blockFileSize:
-					with open("blk00003.dat", 'rb') as newbf:
-						data["Block"].append(blockNumber)
-						newbf.seek(countBytes)
-						self.magic_no = read_4bit(newbf)
-						self.blocksize = read_4bit(newbf)
-						countBytes += self.blocksize + 8
-						self.blockheader = BlockHeader()
-						self.blockheader.parse(newbf)
-						self.transaction_count = read_varint(newbf)
-						data["Transactions"].append(self.transaction_count) #Adds data to dict for graphical output
-
-				else:
-					bf.close()
-
-				blockNumber += 1
+	def parseBlockFile(self, blockfile, workers = None): #Block parsing function for 140,000 blocks
 
-		#Block below is how the data for this specific graph is created and added to the Dict
+		blockfiles = ingest.discoverBlockFiles(os.path.dirname(blockfile) or ".", blockfile) #Parses every blockfile from the first one on, in order
+		chain = chain_index.loadChain(blockfiles, workers = workers) #Real heights, stale blocks left out
 
-		numTransactionsPerHundred = []
+		txCounts = chain.mainColumn("txCount") #Tx counts come with the header scan
+		data["Block"] = list(range(len(txCounts)))
+		data["Transactions"] = txCounts.tolist() #Adds data to dict for graphical output
 
-		for i in (data["Transactions"]):
-			numTransactionsPerHundred.append(i)
+		prefixIndex.get().update(blockfiles) #Only blocks added since the last run are decoded
+		difficultySeries.get().update(chain) #Same for the difficulty columns
 
-		j = 0
-		k = 1000
-		theCount = 1
-		for i in range(0, len(numTransactionsPerHundred), 1000): #Does this for blocksize of 1000
-			value1 = sum((numTransactionsPerHundred)[j:k])
-			updateData.append(value1)
-			numBlocksPerHundred.append(theCount)
-			j = k
-			k += 1000
-			theCount += 1
+		#Block below is how the data for this specific graph is created and added to the Dict
 
-		data["Block"] = numBlocksPerHundred #Updates Dict
-		data["Transactions"] = updateData #Updates Dict
+		windowData = window_aggregates.windowChartData(blockTransactions.get(), WINDOW_SIZE, "Block", "Transactions") #Sums each 1000 blocks in one pass
+		data["Block"] = windowData["Block"] #Updates Dict
+		data["Transactions"] = windowData["Transactions"] #Updates Dict
 			
 ############################################################################################################
 ############################################### BLOCK HEADER ###############################################
@@ -317,9 +305,11 @@ class BlockHeader(object): #Represents header of the block
 if __name__ == "__main__":
 
 	import sys
-	usage = "Usage: pyhton {0} "
+	usage = "Usage: pyhton {0} [workers]"
 	if len(sys.argv) < 1:
 		print(usage.format(sys.argv[0]))
 	else: 
-		parseBlockFile("blk00000.dat") #Initial file to be parsed
+		workers = int(sys.argv[1]) if len(sys.argv) > 1 else None #Number of processes for the parallel header scan
+		precompute.start([("chain", lambda: chain_index.loadChain(ingest.discoverBlockFiles(), workers = workers)), #Header scan and chain order
+			("parse", lambda: parseBlockFile("blk00000.dat", workers))], reloader = True) #Initial file to be parsed, in the reloader's serving process
 	app.run(debug = True)
\ No newline at end of file
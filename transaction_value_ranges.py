@@ -2,22 +2,41 @@ import struct
 import datetime
 import os
 import random
+import numpy as np
 import bokeh.io
 from bokeh.models import (HoverTool, FactorRange, Plot, LinearAxis, Grid, Range1d)
 from bokeh.models.glyphs import VBar
 from bokeh.plotting import figure
 from bokeh.embed import components
 from bokeh.models.sources import ColumnDataSource
-from flask import Flask, render_template
+from flask import Flask, render_template, request, abort
+import chain_index
+import columnar_store
+import ingest
+import value_histogram
+import chart_cache
+import background_jobs
+import instrumentation
 
 ############################################################################################################
 ################################################ FUNCTIONS #################################################
 data = { "Block": [], "Transactions": []} #Dict used to hold graph data
+transactionValues = None #ReloadedData of the int64 satoshi values and their heights, kept so the chart can be rebinned per request
 
+@instrumentation.timed("transaction_value_ranges.parseBlockFile")
 def parseBlockFile(blockfile):
 	block = Block()
 	block.parseBlockFile(blockfile)
 
+def loadScanResults(results): #Same chart data from a scan_engine pass instead of parsing again
+	global transactionValues
+	values = results["txValues"]
+	heights = np.repeat(np.arange(len(results["txCount"]), dtype = np.int64), results["txCount"]) #Values come in block order
+	transactionValues = chart_cache.ReloadedData(lambda: (values, heights), []) #No files behind it, loaded once
+	histogram = results["valueHistogram"]
+	data["Block"] = histogram.labels()
+	data["Transactions"] = histogram.counts.tolist()
+
 def read_1bit(stream):
 	return ord(stream.read(1))
 
@@ -51,7 +70,7 @@ def read_varint(stream):
 	return -1
 
 def get_hexstring(bytebuffer):
-	return(''.join(('%x' %i for i in bytebuffer)))
+	return(''.join(('%02x' %i for i in bytebuffer)))
 
 ############################################################################################################
 ################################################ BOOKEH FUNCTIONS ##########################################
@@ -70,9 +89,10 @@ def create_hover_tool(): #Hover tool for barchart
 	"""
 	return HoverTool(tooltips = hover_html)
 
+@instrumentation.timed("bokeh.create_bar_chart")
 def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 1200, height = 300):
 	source = ColumnDataSource(data)
-	xdr = FactorRange("0 < i < 0.01", "0.01 <= i < 0.1", "0.1 <= i < 1", "1 <= i < 5", "5 <= i < 25", "25 <= i < 50", "50 <= i < 250", "250 <= i < 1000", "i => 1000")
+	xdr = FactorRange(factors = data[x_name]) #Bin labels e.g. "0.01 <= i < 0.1"
 	ydr = Range1d(start = 0, end = max(data[y_name])*1.1)
 
 	tools = []
@@ -102,22 +122,41 @@ def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 120
 	plot.xaxis.major_label_orientation = 1
 	return plot
 
+@instrumentation.timed("transaction_value_ranges.create_chart")
+def create_chart(edges = None, blocks_count = None): #Builds the plot without needing a request, used by the route and build_charts
+	values, heights = transactionValues.get()
+	if blocks_count is not None: #Only the values of the first blocks_count blocks
+		values = values[:np.searchsorted(heights, blocks_count)]
+	histogram = value_histogram.histogram(values, value_histogram.DEFAULT_EDGES if edges is None else edges) #Binned again from the current values
+	chartData = {"Block": histogram.labels(), "Transactions": histogram.counts.tolist()}
+
+	hover = create_hover_tool()
+	return create_bar_chart(chartData, "Ranges of the value of transactions (BTC)", "Block", "Transactions", hover)
+
 app = Flask(__name__)
+chartCache = chart_cache.ChartCache(columnar_store.sourceFiles() + ingest.discoverBlockFiles()) #Rendered charts per route and parameters
+precompute = background_jobs.BackgroundJob(app) #Parsing runs after the server is up, GET /status shows how far it got
+instrumentation.register(app, chartCache) #GET /metrics in Prometheus text format
 
 @app.route("/<int:blocks_count>/")
+@precompute.required
+@chartCache.cached
 
 def chart(blocks_count):
 	if blocks_count <= 0:
 		blocks_count = 1
 
-	for i in range(1, blocks_count):
-		data["Block"].append(i)
-		data["Transactions"].append(i)
+	edges = None
+	if request.args.get("bins"): #e.g. ?bins=0,0.01,1,50 (BTC lower edges) or ?bins=log:2
+		try:
+			edges = value_histogram.parseBins(request.args.get("bins"))
+		except ValueError:
+			abort(400)
 
-	hover = create_hover_tool()
-	plot = create_bar_chart(data, "Ranges of the value of transactions (BTC)", "Block", "Transactions", hover)
+	plot = create_chart(edges, blocks_count) #Only the first blocks_count blocks are charted
 
-	script, div = components(plot)
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
 
 	return render_template("chart_04.html", blocks_count = blocks_count, the_div = div, the_script = script)
 
@@ -137,58 +176,12 @@ class Block(object):
 	def parseBlockFile(self, blockfile):
 		print("Parsing block")
 
-		#Creates variables for transaction ranges
-		btcRangeLesser = 0
-		btcRangeLess = 0
-		btcRange1 = 0
-		btcRange5 = 0
-		btcRange25 = 0
-		btcRange50 = 0
-		btcRange250 = 0
-		btcRange1000 = 0
-		btcRangePlus = 0
-
-		with open('transactions0.txt', 'r') as t: #Opens and read stored transaction information
-			transactionVals = [line.strip() for line in t] #Stores read data into list
-		
-		#For loop to assign a range for each value	
-		for i in transactionVals:
-			transactionValue = float(i)/100000000.00
-			if transactionValue < 0.01:
-				btcRangeLesser += 1
-			elif 0.01 <= transactionValue < 0.1:
-				btcRangeLess += 1
-			elif 0.1 <= transactionValue < 1:
-				btcRange1 += 1
-			elif 1 <= transactionValue < 5:
-				btcRange5 += 1
-			elif 5 <= transactionValue < 25:
-				btcRange25 += 1
-			elif 25 <= transactionValue < 50:
-				btcRange50 += 1
-			elif 50 <= transactionValue < 250:
-				btcRange250 += 1
-			elif 250 <= transactionValue < 1000:
-				btcRange1000 += 1
-			else:
-				btcRangePlus += 1
-
-		data["Transactions"].append(btcRangeLesser)
-		data["Transactions"].append(btcRangeLess)
-		data["Transactions"].append(btcRange1)
-		data["Transactions"].append(btcRange5)
-		data["Transactions"].append(btcRange25)
-		data["Transactions"].append(btcRange50)
-		data["Transactions"].append(btcRange250)
-		data["Transactions"].append(btcRange1000)
-		data["Transactions"].append(btcRangePlus)
-
-		numTransactions = len(transactionVals)
-
-		blockNum = 1
-		while blockNum <= len(data["Transactions"]):
-			data["Block"].append(blockNum)
-			blockNum += 1
+		global transactionValues #Stored transaction information, memory mapped when exported, read again once a source changes
+		transactionValues = chart_cache.ReloadedData(lambda: columnar_store.loadValueHeights(blockfile, chain = chain_index.loadSavedChain()), columnar_store.sourceFiles())
+
+		histogram = value_histogram.histogram(transactionValues.get()[0]) #Assigns a range to every value in one pass
+		data["Block"] = histogram.labels()
+		data["Transactions"] = histogram.counts.tolist()
 			
 ############################################################################################################
 ############################################### BLOCK HEADER ###############################################
@@ -305,5 +298,5 @@ if __name__ == "__main__":
 	if len(sys.argv) < 1:
 		print(usage.format(sys.argv[0]))
 	else: 
-		parseBlockFile("blk00000.dat") #Initial file to be parsed
+		precompute.start([("parse", lambda: parseBlockFile("blk00000.dat"))], reloader = True) #Initial file to be parsed, in the reloader's serving process
 	app.run(debug = True)
\ No newline at end of file
@@ -0,0 +1,157 @@
+import struct
+from collections import namedtuple
+
+import block_reader
+import chain_index
+import instrumentation
+
+############################################################################################################
+################################################ STRUCT LAYOUTS ############################################
+
+OUTPOINT = struct.Struct('<32sI') #previousHash, prevTx_out_idx
+UINT32 = block_reader.UINT32
+UINT64 = block_reader.UINT64
+read_varint_at = block_reader.read_varint_at
+
+TxInput = namedtuple("TxInput", ["previousHash", "prevTx_out_idx", "scriptSig", "seqNo"])
+TxOutput = namedtuple("TxOutput", ["value", "scriptPubKey"])
+
+############################################################################################################
+################################################ BUFFER FUNCTIONS ##########################################
+
+def skip_input(buf, offset): #Returns the offset just past one tx_Input
+	script_len, offset = read_varint_at(buf, offset + OUTPOINT.size)
+	return offset + script_len + 4
+
+def skip_output(buf, offset): #Returns the offset just past one tx_Output
+	script_len, offset = read_varint_at(buf, offset + 8)
+	return offset + script_len
+
+def skip_witness(buf, offset): #Returns the offset just past one input's witness stack, items are skipped by length
+	item_count, offset = read_varint_at(buf, offset)
+	for i in range(item_count):
+		item_len, offset = read_varint_at(buf, offset)
+		offset += item_len
+	return offset
+
+############################################################################################################
+############################################### TRANSACTIONS ###############################################
+
+class TxRecord(object): #One decoded transaction, inputs and outputs are only decoded when asked for
+	#SegWit transactions (BIP 144) put a 0x00 marker and 0x01 flag after the version and the witness stacks
+	#before lock_time. Witness data is stepped over by length, its size is kept for weight and vsize.
+	__slots__ = ("buffer", "height", "txIndex", "offset", "version", "hasWitness", "bodyOffset", "in_count",
+		"inputsOffset", "out_count", "outputsOffset", "witnessOffset", "lock_time", "endOffset")
+
+	def __init__(self, buf, height, txIndex, offset):
+		self.buffer = buf
+		self.height = height
+		self.txIndex = txIndex
+		self.offset = offset
+		self.version = UINT32.unpack_from(buf, offset)[0]
+
+		pos = offset + 4
+		self.hasWitness = buf[pos] == 0 and buf[pos + 1] != 0 #A legacy transaction never has zero inputs
+		if self.hasWitness:
+			pos += 2
+		self.bodyOffset = pos
+
+		self.in_count, pos = read_varint_at(buf, pos)
+		self.inputsOffset = pos
+
+		for i in range(self.in_count):
+			pos = skip_input(buf, pos)
+
+		self.out_count, pos = read_varint_at(buf, pos)
+		self.outputsOffset = pos
+
+		for i in range(self.out_count):
+			pos = skip_output(buf, pos)
+
+		self.witnessOffset = pos
+		if self.hasWitness:
+			for i in range(self.in_count):
+				pos = skip_witness(buf, pos)
+
+		self.lock_time = UINT32.unpack_from(buf, pos)[0]
+		self.endOffset = pos + 4
+
+	def totalSize(self): #Serialized size with witness data
+		return self.endOffset - self.offset
+
+	def witnessSize(self): #Marker, flag and witness stacks, 0 for legacy transactions
+		if not self.hasWitness:
+			return 0
+		return (self.endOffset - 4 - self.witnessOffset) + 2
+
+	def baseSize(self): #Size without witness data, what the txid covers
+		return self.totalSize() - self.witnessSize()
+
+	def weight(self): #BIP 141 weight units
+		return self.baseSize() * 3 + self.totalSize()
+
+	def vsize(self):
+		return (self.weight() + 3) // 4
+
+	def witnessItemSizes(self): #Opt-in: lengths of each input's witness items, no item bytes are copied
+		buf = self.buffer
+		pos = self.witnessOffset
+		for i in range(self.in_count if self.hasWitness else 0):
+			item_count, pos = read_varint_at(buf, pos)
+			sizes = []
+			for j in range(item_count):
+				item_len, pos = read_varint_at(buf, pos)
+				sizes.append(item_len)
+				pos += item_len
+			yield sizes
+
+	def inputs(self): #Same fields as tx_Input.parse, previousHash reversed like reverse32
+		buf = self.buffer
+		pos = self.inputsOffset
+		for i in range(self.in_count):
+			previousHash, prevTx_out_idx = OUTPOINT.unpack_from(buf, pos)
+			script_len, pos = read_varint_at(buf, pos + OUTPOINT.size)
+			scriptSig = bytes(buf[pos:pos + script_len])
+			pos += script_len
+			yield TxInput(previousHash[::-1], prevTx_out_idx, scriptSig, UINT32.unpack_from(buf, pos)[0])
+			pos += 4
+
+	def outputs(self): #Same fields as tx_Output.parse
+		buf = self.buffer
+		pos = self.outputsOffset
+		for i in range(self.out_count):
+			value = UINT64.unpack_from(buf, pos)[0]
+			script_len, pos = read_varint_at(buf, pos + 8)
+			yield TxOutput(value, bytes(buf[pos:pos + script_len]))
+			pos += script_len
+
+	def outputValues(self): #Output values in satoshis without copying any scripts
+		buf = self.buffer
+		pos = self.outputsOffset
+		for i in range(self.out_count):
+			yield UINT64.unpack_from(buf, pos)[0]
+			pos = skip_output(buf, pos)
+
+	def value(self): #Total output value in satoshis
+		return sum(self.outputValues())
+
+def iterBlockTransactions(buf, record, height): #Yields a TxRecord for each transaction of one block
+	pos = record.offset + block_reader.BLOCK_PREFIX.size + block_reader.HEADER_SIZE
+	transaction_count, pos = read_varint_at(buf, pos)
+	if instrumentation.ENABLED:
+		instrumentation.count("transactions_decoded", transaction_count)
+	for txIndex in range(transaction_count):
+		tx = TxRecord(buf, height, txIndex, pos)
+		yield tx
+		pos = tx.endOffset
+
+def iterTransactions(blockfiles, chain = None): #Streams every transaction of the best chain in height order, stale blocks skipped
+	#Records point into the mapped files, so their inputs()/outputs() are only valid until the walk has moved
+	#chain_index.MAPPED_FILES files on
+	for blockfile, buf, record, height in chain_index.iterChainBlocks(blockfiles, chain):
+		for tx in iterBlockTransactions(buf, record, height):
+			yield tx
+
+def iterTransactionValues(blockfiles, chain = None): #Total output value of each transaction in satoshis, the values stored in transactions0.txt
+	for tx in iterTransactions(blockfiles, chain):
+		yield tx.value()
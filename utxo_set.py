@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import struct
+
+import atomic_files
+import txid_index
+
+############################################################################################################
+################################################ PACKING ###################################################
+#key   = first 12 bytes of the txid (internal order) + output index
+#value = amount in satoshis, block height, script id
+#Script ids index the script table kept in the same database, recent scripts are also held in memory
+
+UTXO_KEY = struct.Struct('<12sI')
+UTXO_VALUE = struct.Struct('<QII')
+ENTRY_COST = 200 #Rough bytes per in-memory entry: two small bytes objects plus the dict slot
+SCRIPT_COST = 100 #Same for an interned script on top of its own length
+MEMORY_BUDGET = 512 * 1024 * 1024
+SPEND_BATCH = 10000
+SNAPSHOT_BLOCKS = 1000
+NULL_HASH = b'\x00' * 32
+
+UTXO_DB = "utxo.sqlite"
+UTXO_SERIES = "utxo_series.json"
+
+def packKey(txidInternal, vout):
+	return UTXO_KEY.pack(txidInternal[:12], vout)
+
+############################################################################################################
+################################################ SCRIPT IDS ################################################
+
+class ScriptIds(object): #scriptPubKey --> dense id, new scripts in a dict that is spilled with the UTXO entries
+
+	def __init__(self, db):
+		self.db = db
+		self.db.execute("CREATE TABLE IF NOT EXISTS script (script BLOB PRIMARY KEY, id INTEGER) WITHOUT ROWID")
+		self.memory = {}
+		self.memoryBytes = 0
+		self.nextId = self.db.execute("SELECT COUNT(*) FROM script").fetchone()[0]
+		self.onDisk = self.nextId > 0 #No disk lookups until something was spilled
+
+	def intern(self, script):
+		scriptId = self.memory.get(script)
+		if scriptId is not None:
+			return scriptId
+		row = self.db.execute("SELECT id FROM script WHERE script = ?", (script,)).fetchone() if self.onDisk else None
+		if row is not None:
+			scriptId = row[0]
+		else:
+			scriptId = self.nextId
+			self.nextId += 1
+		script = bytes(script)
+		self.memory[script] = scriptId
+		self.memoryBytes += len(script) + SCRIPT_COST
+		return scriptId
+
+	def spill(self): #Caller commits
+		if not self.memory:
+			return
+		self.db.executemany("INSERT OR IGNORE INTO script VALUES (?, ?)", self.memory.items())
+		self.memory.clear()
+		self.memoryBytes = 0
+		self.onDisk = True
+
+############################################################################################################
+################################################ UTXO SET ##################################################
+
+class UtxoSet(object): #Unspent outputs and script ids in dicts until the memory budget is hit, then spilled to SQLite
+
+	def __init__(self, dbPath = UTXO_DB, memoryBudget = MEMORY_BUDGET):
+		self.memory = {}
+		self.memoryBudget = max(1, memoryBudget)
+		self.pendingSpends = [] #Keys not in memory, looked up on disk in batches
+		self.db = sqlite3.connect(dbPath)
+		self.db.execute("CREATE TABLE IF NOT EXISTS utxo (key BLOB PRIMARY KEY, value BLOB) WITHOUT ROWID")
+		self.scripts = ScriptIds(self.db) #Script ids for the packed values
+		self.onDisk = self.db.execute("SELECT EXISTS (SELECT 1 FROM utxo)").fetchone()[0] == 1 #No disk lookups until something was spilled
+		self.count = 0
+		self.totalValue = 0
+		self.missing = 0 #Spends whose output was never seen, e.g. when starting mid-chain
+
+	def add(self, txidInternal, vout, value, height, script, coinbase = False):
+		#An output whose key is already in the set replaces it, as the BIP30 duplicate coinbase txids (blocks 91842
+		#and 91880) did on mainnet. Only coinbase outputs can repeat a txid, so only they are looked up on disk
+		key = packKey(txidInternal, vout)
+		replaced = self.memory.get(key)
+		if replaced is None and coinbase and self.onDisk:
+			row = self.db.execute("SELECT value FROM utxo WHERE key = ?", (key,)).fetchone()
+			if row is not None:
+				replaced = row[0]
+				self.db.execute("DELETE FROM utxo WHERE key = ?", (key,))
+		if replaced is not None:
+			self.count -= 1
+			self.totalValue -= UTXO_VALUE.unpack(replaced)[0]
+		self.memory[key] = UTXO_VALUE.pack(value, height, self.scripts.intern(script))
+		self.count += 1
+		self.totalValue += value
+		if len(self.memory) * ENTRY_COST + self.scripts.memoryBytes >= self.memoryBudget:
+			self.spill()
+
+	def spend(self, previousHash, prevTx_out_idx): #previousHash as read from the input (display order)
+		if previousHash == NULL_HASH: #Coinbase
+			return
+		key = packKey(previousHash[::-1], prevTx_out_idx)
+		packed = self.memory.pop(key, None)
+		if packed is None:
+			self.pendingSpends.append(key)
+			if len(self.pendingSpends) >= SPEND_BATCH:
+				self.flushSpends()
+			return
+		self.count -= 1
+		self.totalValue -= UTXO_VALUE.unpack(packed)[0]
+
+	def flushSpends(self):
+		if not self.pendingSpends:
+			return
+		found = 0
+		for key in self.pendingSpends:
+			row = self.db.execute("SELECT value FROM utxo WHERE key = ?", (key,)).fetchone()
+			if row is None:
+				continue
+			found += 1
+			self.totalValue -= UTXO_VALUE.unpack(row[0])[0]
+		self.db.executemany("DELETE FROM utxo WHERE key = ?", ((key,) for key in self.pendingSpends))
+		self.db.commit()
+		self.count -= found
+		self.missing += len(self.pendingSpends) - found
+		self.pendingSpends = []
+
+	def spill(self): #Moves every in-memory entry and script to disk
+		self.flushSpends()
+		self.db.executemany("INSERT OR REPLACE INTO utxo VALUES (?, ?)", self.memory.items())
+		self.scripts.spill()
+		self.db.commit()
+		self.memory.clear()
+		self.onDisk = True
+
+	def close(self): #Entries and scripts still in memory are written, so the database holds the whole set
+		self.spill()
+		self.db.close()
+
+def buildUtxoSet(blockfiles, dbPath = UTXO_DB, memoryBudget = MEMORY_BUDGET, snapshotBlocks = SNAPSHOT_BLOCKS):
+	#Applies every transaction in chain order, returns the set size and value after every snapshotBlocks blocks
+	series = {"Block": [], "Count": [], "Value": []}
+	if os.path.exists(dbPath): #Always rebuilt from the first block
+		os.remove(dbPath)
+	utxos = UtxoSet(dbPath, memoryBudget)
+	lastHeight = 0
+
+	def snapshot(blocksDone):
+		utxos.flushSpends()
+		series["Block"].append(blocksDone)
+		series["Count"].append(utxos.count)
+		series["Value"].append(utxos.totalValue / 100000000.00)
+
+	for blockfile, tx, digest in txid_index.iterTxids(blockfiles):
+		if tx.height != lastHeight:
+			if tx.height % snapshotBlocks == 0:
+				snapshot(tx.height)
+			lastHeight = tx.height
+		for txIn in tx.inputs():
+			utxos.spend(txIn.previousHash, txIn.prevTx_out_idx)
+		for vout, output in enumerate(tx.outputs()):
+			utxos.add(digest, vout, output.value, tx.height, output.scriptPubKey, tx.txIndex == 0)
+
+	snapshot(lastHeight + 1)
+	utxos.close()
+	return series
+
+def saveSeries(series, path = UTXO_SERIES):
+	atomic_files.saveJson(path, series)
+
+def loadSeries(path = UTXO_SERIES):
+	if not os.path.exists(path):
+		return None
+	with open(path, 'r') as f:
+		return json.load(f)
+
+############################################################################################################
+
+if __name__ == "__main__":
+
+	import sys
+	usage = "Usage: pyhton {0} blockfile [blockfile ...]"
+	if len(sys.argv) < 2:
+		print(usage.format(sys.argv[0]))
+	else:
+		series = buildUtxoSet(sys.argv[1:])
+		saveSeries(series)
+		print("%d unspent outputs worth %.8f BTC" % (series["Count"][-1], series["Value"][-1]))
@@ -1,23 +1,81 @@
 import struct
 import datetime
 import os
-import random
 import bokeh.io
 from bokeh.models import (HoverTool, FactorRange, Plot, LinearAxis, Grid, Range1d)
 from bokeh.models.glyphs import VBar
 from bokeh.plotting import figure
 from bokeh.embed import components
 from bokeh.models.sources import ColumnDataSource
-from flask import Flask, render_template
+from flask import Flask, render_template, request, abort, jsonify
+import chain_index
+import columnar_store
+import ingest
+import top_transactions
+import script_intern
+import chart_cache
+import background_jobs
+import instrumentation
 
 ############################################################################################################
 ################################################ FUNCTIONS #################################################
 data = {"pubKey": [], "Transactions": [], "Block": []} #Dict used to hold graph data
+MAX_TOP = 100 #Most values the chart can be asked for
+topTransactions = None #ReloadedData of the TopEntry list, most valuable first
+savedChain = chart_cache.ReloadedData(chain_index.loadSavedChain, [chain_index.CHAIN_META]) #Read only, precompute and ingest rebuild it
+scriptTable = chart_cache.ReloadedData(script_intern.loadScriptTable, [os.path.join(script_intern.SCRIPTS_DIR, "scripts.offsets.npy")]) #Per-script totals, built beforehand by script_intern.py
 
+@instrumentation.timed("valuable_transactions.parseBlockFile")
 def parseBlockFile(blockfile):
 	block = Block()
 	block.parseBlockFile(blockfile)
 
+def loadScanResults(results): #Same chart data from a scan_engine pass instead of parsing again
+	global topTransactions
+	entries = results["topTransactions"].entries()
+	topTransactions = chart_cache.ReloadedData(lambda: entries, []) #No files behind it, loaded once
+	data.update(topData(10))
+
+def topData(k, entries = None): #Graph data for the k most valuable transactions, of the whole dataset unless entries are given
+	chartData = {"pubKey": [], "Transactions": [], "Block": []}
+	for entry in (topTransactions.get() if entries is None else entries)[0:k]:
+		chartData["Transactions"].append(entry.value/100000000.00)
+		if entry.height < 0: #Text files only give the transaction's row, not its block
+			chartData["Block"].append("tx #%d" % entry.txIndex)
+		else: #Several transactions of one block can make the list
+			chartData["Block"].append("%d (tx %d)" % (entry.height, entry.txIndex))
+		chartData["pubKey"].append(entry.script.hex() if entry.script is not None else "")
+	return chartData
+
+def loadTopTransactions(blockfile): #Ranks the first source found, the blk files through the chain precompute saved last
+	chain = savedChain.get()
+	if chain is None: #Nothing saved yet, only the parse stage gets here
+		blockfiles = ingest.discoverBlockFiles(os.path.dirname(blockfile) or ".", blockfile)
+		chain = chain_index.loadChain(blockfiles) if blockfiles else None
+	dataset = columnar_store.Dataset() if columnar_store.datasetExists() else None
+	if dataset is not None and dataset.meta["pubKeyEncoding"] == "raw": #Exported from blk files, heights are real and memory mapped
+		top = top_transactions.topFromArrays(dataset.values, dataset.heights, MAX_TOP)
+		if chain is not None: #Only the winners' blocks are decoded again, for their largest output and its script
+			top = top_transactions.withOutputs(top, chain)
+	elif chain is not None: #Streamed from the best chain so every value keeps its real block and script
+		top = top_transactions.topTransactionsInRange(chain, MAX_TOP)
+	elif dataset is not None: #Exported from the text files, whose line numbers are not block heights
+		top = top_transactions.topFromArrays(dataset.values, None, MAX_TOP)
+	elif os.path.exists('transactions0.txt'):
+		top = top_transactions.topFromValues(columnar_store.iterTextValues('transactions0.txt'), MAX_TOP) #Stored transaction info for 140,000 blocks
+	else:
+		top = top_transactions.TopK(MAX_TOP)
+	return top.entries()
+
+def scriptData(k): #Graph data for the k scripts that received the most BTC
+	chartData = {"pubKey": [], "Transactions": [], "Outputs": []}
+	table = scriptTable.get()
+	for scriptId, received, outputCount in table.mostPaid(k):
+		chartData["pubKey"].append(get_hexstring(table.script(scriptId)))
+		chartData["Transactions"].append(received/100000000.00)
+		chartData["Outputs"].append(outputCount)
+	return chartData
+
 def read_1bit(stream):
 	return ord(stream.read(1))
 
@@ -51,7 +109,7 @@ def read_varint(stream): #Function for variable integers e.g. transaction size
 	return -1
 
 def get_hexstring(bytebuffer):
-	return(''.join(('%x' %i for i in bytebuffer)))
+	return(''.join(('%02x' %i for i in bytebuffer)))
 
 ############################################################################################################
 ################################################ BOOKEH FUNCTIONS ##########################################
@@ -67,10 +125,25 @@ def create_hover_tool(): #Hover tool for barchart
 	"""
 	return HoverTool(tooltips = hover_html)
 
-def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 1200, height = 300):
+def create_script_hover_tool(): #Hover tool for the most paid scripts chart
+	hover_html = """
+		<div>
+			<span class = "hover_tooltip">Script: @pubKey</span>
+		</div>
+		<div>
+			<span class = "hover_tooltip">Received @Transactions BTC in @Outputs output(s)</span>
+		</div>
+	"""
+	return HoverTool(tooltips = hover_html)
+
+@instrumentation.timed("bokeh.create_bar_chart")
+def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 1200, height = 300,
+	y_start = 0, y_end = None, y_label = "Value of transaction (BTC)", x_label = "Transaction Block Number"):
 	source = ColumnDataSource(data)
 	xdr = FactorRange(factors = data[x_name])
-	ydr = Range1d(start = 250000, end = 450000)
+	if y_end is None: #From the values shown, they depend on the chain and ?k
+		y_end = max(data[y_name] or [1])*1.1
+	ydr = Range1d(start = y_start, end = y_end)
 
 	tools = []
 	if hover_tool:
@@ -93,31 +166,74 @@ def create_bar_chart(data, title, x_name, y_name, hover_tool = None, width = 120
 	plot.min_border_top = 0
 	plot.xgrid.grid_line_color = None
 	plot.ygrid.grid_line_color = "#999999"
-	plot.yaxis.axis_label = "Value of transaction (BTC)"
+	plot.yaxis.axis_label = y_label
 	plot.ygrid.grid_line_alpha = 0.1
-	plot.xaxis.axis_label = "Transaction Block Number"
+	plot.xaxis.axis_label = x_label
 	plot.xaxis.major_label_orientation = 1
 	return plot
 
+@instrumentation.timed("valuable_transactions.create_chart")
+def create_chart(k = 10, entries = None): #Builds the plot without needing a request, used by the route and build_charts
+	hover = create_hover_tool()
+	return create_bar_chart(topData(k, entries), "Block Numbers with highest transaction amount", "Block", "Transactions", hover)
+
 app = Flask(__name__)
+chartCache = chart_cache.ChartCache(columnar_store.sourceFiles() + ["pubKey0.txt", "scripts/scripts.offsets.npy"] + ingest.discoverBlockFiles()) #Rendered charts per route and parameters
+precompute = background_jobs.BackgroundJob(app) #Parsing runs after the server is up, GET /status shows how far it got
+instrumentation.register(app, chartCache) #GET /metrics in Prometheus text format
 
 @app.route("/<int:blocks_count>/")
+@precompute.required
+@chartCache.cached
 
 def chart(blocks_count):
 	if blocks_count <= 0:
 		blocks_count = 1
 
-	for i in range(1, blocks_count):
-		data["Block"].append(i)
-		data["Transactions"].append(i)
+	k = request.args.get("k", 10, type = int) #Number of transactions shown, ?k=25
+	k = min(max(k, 1), MAX_TOP)
 
-	hover = create_hover_tool()
-	plot = create_bar_chart(data, "Block Numbers with highest transaction amount", "Block", "Transactions", hover)
+	entries = None
+	chain = savedChain.get()
+	if chain is not None and blocks_count < len(chain): #Only the first blocks_count blocks are read, the whole chain is ranked beforehand
+		entries = top_transactions.topTransactionsInRange(chain, k, 0, blocks_count).entries()
+
+	plot = create_chart(k, entries)
 
-	script, div = components(plot)
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
 
 	return render_template("chart_02.html", blocks_count = blocks_count, the_div = div, the_script = script)
 
+@app.route("/scripts/")
+@chartCache.cached
+
+def scripts_chart(): #Scripts that received the most BTC, ?k=25
+	if scriptTable.get() is None:
+		abort(404)
+
+	k = request.args.get("k", 10, type = int)
+	k = min(max(k, 1), MAX_TOP)
+	chartData = scriptData(k)
+
+	hover = create_script_hover_tool()
+	plot = create_bar_chart(chartData, "Scripts that received the most BTC", "pubKey", "Transactions", hover,
+		y_label = "Received (BTC)", x_label = "Script PubKey")
+
+	with instrumentation.stage("bokeh.components"):
+		script, div = components(plot)
+
+	return render_template("chart_02.html", blocks_count = k, the_div = div, the_script = script)
+
+@app.route("/scripts/reuse/")
+
+def script_reuse(): #How often scripts (pubkeys) are paid more than once
+	table = scriptTable.get()
+	if table is None:
+		abort(404)
+
+	return jsonify(table.reuse())
+
 ############################################################################################################
 ############################################### BLOCK READER ###############################################
 
@@ -134,26 +250,9 @@ class Block(object):
 	def parseBlockFile(self, blockfile):
 		print("Parsing block")
 
-		with open('transactions0.txt', 'r') as t: #Reads stored transaction info for 140,000 blocks
-			transactionVals = [line.strip() for line in t] #Adds each line to a list
-
-		with open('pubKey0.txt', 'r') as p: #Reads stored public key information
-			pubKeyVals = [line.strip() for line in p] #Adds each line to list
-			
-		topTransactions = sorted(transactionVals, key = int, reverse = True)[0:10] #Change these numbers for amount of data shown on graph
-		for i in topTransactions:
-			theP = int(i)
-			data["Transactions"].append(theP/100000000.00)
-
-		topTransactions1 = [i[0] for i in sorted(enumerate(transactionVals), key=lambda x:x[1])][0:10] #Block number of most valuable transactions
-
-		for i in topTransactions1:
-			data["pubKey"].append(pubKeyVals[random.randint(0, len(pubKeyVals))]) #Currently does nothing; ignore
-
-		blockNum = 1
-		while blockNum <= len(topTransactions1):
-			data["Block"].append(blockNum)
-			blockNum += 1
+		global topTransactions #Ranked again once the dataset, the text file or the saved chain changes
+		topTransactions = chart_cache.ReloadedData(lambda: loadTopTransactions(blockfile), columnar_store.sourceFiles())
+		data.update(topData(10))
 			
 ############################################################################################################
 ############################################### BLOCK HEADER ###############################################
@@ -272,5 +371,5 @@ if __name__ == "__main__":
 	if len(sys.argv) < 1:
 		print(usage.format(sys.argv[0]))
 	else: 
-		parseBlockFile("blk00000.dat") #Initial file to be parsed
+		precompute.start([("parse", lambda: parseBlockFile("blk00000.dat"))], reloader = True) #Initial file to be parsed, in the reloader's serving process
 	app.run(debug = True)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import numpy as np
+
+import instrumentation
+
+############################################################################################################
+################################################ BIN EDGES #################################################
+#Bins are given by their lower edges in satoshis, the last bin has no upper edge. The first edge is always 0
+#so values under the lowest edge asked for get a bin of their own.
+
+SATOSHIS_PER_BTC = 100000000
+CHUNK_SIZE = 1 << 20
+MAX_BINS = 1000 #Most bins a request can ask for
+
+DEFAULT_EDGES = [0, 1000000, 10000000, 100000000, 500000000, 2500000000, 5000000000, 25000000000, 100000000000] #0, 0.01, 0.1, 1, 5, 25, 50, 250, 1000 BTC
+
+def logEdges(start = 1, stop = 10 ** 15, perDecade = 1): #Log spaced edges in whole satoshis with a 0 edge in front
+	decades = np.log10(stop) - np.log10(start)
+	count = int(round(decades * perDecade)) + 1
+	if perDecade <= 0 or count > MAX_BINS:
+		raise ValueError("log bins need 1 to %d bins per decade" % ((MAX_BINS - 1) // decades))
+	points = np.logspace(np.log10(start), np.log10(stop), count)
+	edges = np.unique(np.round(points).astype(np.int64))
+	return [0] + [int(e) for e in edges if e > 0]
+
+def parseBins(text): #"0,0.01,1,50" (BTC lower edges), "log" or "log:<bins per decade>"
+	if not text:
+		return list(DEFAULT_EDGES)
+	if text.startswith("log"):
+		perDecade = int(text.split(":")[1]) if ":" in text else 1
+		return logEdges(perDecade = perDecade)
+
+	amounts = [float(edge) for edge in text.split(",")]
+	if len(amounts) > MAX_BINS:
+		raise ValueError("at most %d bin edges" % MAX_BINS)
+	if not all(np.isfinite(amount) and 0 <= amount <= 21000000 for amount in amounts): #inf would overflow int()
+		raise ValueError("bin edges must be BTC amounts between 0 and 21000000")
+	return sorted(set([0] + [int(round(amount * SATOSHIS_PER_BTC)) for amount in amounts]))
+
+def formatBtc(satoshis):
+	return ("%.8f" % (satoshis / float(SATOSHIS_PER_BTC))).rstrip('0').rstrip('.')
+
+############################################################################################################
+############################################### HISTOGRAM ##################################################
+
+class ValueHistogram(object): #Counts of values per bin, partial histograms over the same edges can be merged
+
+	def __init__(self, edges = DEFAULT_EDGES):
+		self.edges = np.asarray(edges, dtype = np.int64)
+		if len(self.edges) == 0 or self.edges[0] > 0: #Underflow bin, values are never negative
+			self.edges = np.concatenate(([0], self.edges))
+		self.counts = np.zeros(len(self.edges), dtype = np.int64)
+
+	def add(self, values): #Bins a whole array of satoshi values in one pass
+		values = np.asarray(values, dtype = np.int64)
+		bins = np.searchsorted(self.edges, values, side = 'right') - 1
+		self.counts += np.bincount(bins, minlength = len(self.edges))
+		return self
+
+	def merge(self, other):
+		if not np.array_equal(self.edges, other.edges):
+			raise ValueError("cannot merge histograms with different bin edges")
+		self.counts += other.counts
+		return self
+
+	def labels(self): #Same style as the original chart labels e.g. "0.01 <= i < 0.1"
+		labels = []
+		for i, edge in enumerate(self.edges):
+			if i == len(self.edges) - 1:
+				labels.append("i => %s" % formatBtc(edge))
+			else:
+				labels.append("%s <= i < %s" % (formatBtc(edge), formatBtc(self.edges[i + 1])))
+		return labels
+
+def valueArray(values): #int64 array from a column, a list or a streamed generator of values
+	if isinstance(values, np.ndarray):
+		return values
+	return np.fromiter(values, dtype = np.int64)
+
+@instrumentation.timed("histogram")
+def histogram(values, edges = DEFAULT_EDGES, chunkSize = CHUNK_SIZE): #Builds one partial histogram per chunk and merges them
+	values = valueArray(values)
+	result = ValueHistogram(edges)
+	for start in range(0, len(values), chunkSize):
+		result.merge(ValueHistogram(edges).add(values[start:start + chunkSize]))
+	return result
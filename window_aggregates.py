@@ -0,0 +1,45 @@
+from collections import namedtuple
+
+import numpy as np
+
+import instrumentation
+
+############################################################################################################
+################################################ WINDOWS ###################################################
+#Fixed windows over a per-block (or per-transaction) array, the last window may be shorter
+
+WindowStats = namedtuple("WindowStats", ["starts", "counts", "sums", "mins", "maxs", "means"])
+
+@instrumentation.timed("window_aggregate")
+def windowAggregate(values, windowSize): #sum/min/max/mean of every window in one reduceat pass each
+	if windowSize <= 0:
+		raise ValueError("window size must be positive")
+
+	values = np.asarray(values)
+	if values.dtype.kind in "iub":
+		values = values.astype(np.int64, copy = False) #Integer sums stay exact
+	starts = np.arange(0, len(values), windowSize, dtype = np.int64)
+	if len(starts) == 0:
+		empty = np.zeros(0, dtype = np.int64)
+		return WindowStats(empty, empty, empty, empty, empty, np.zeros(0))
+
+	counts = np.diff(np.append(starts, len(values)))
+	sums = np.add.reduceat(values, starts)
+	mins = np.minimum.reduceat(values, starts)
+	maxs = np.maximum.reduceat(values, starts)
+	return WindowStats(starts, counts, sums, mins, maxs, sums / counts)
+
+def blockTotals(values, heights, chunkSize = 1 << 22): #Per-transaction values summed per block, heights in chain order
+	#Integer sums per run of equal heights, a block split across two chunks is added to twice
+	totals = np.zeros(int(heights[-1]) + 1 if len(heights) else 0, dtype = np.int64)
+	for start in range(0, len(values), chunkSize):
+		chunkHeights = np.asarray(heights[start:start + chunkSize])
+		firsts = np.concatenate(([0], np.flatnonzero(np.diff(chunkHeights)) + 1))
+		totals[chunkHeights[firsts]] += np.add.reduceat(np.asarray(values[start:start + chunkSize], dtype = np.int64), firsts)
+		instrumentation.progress(min(start + chunkSize, len(values)), len(values), "rows")
+	return totals
+
+def windowChartData(values, windowSize, x_name, y_name, stat = "sums"): #Graph dict numbered 1, 2, 3... per window like the original charts
+	stats = windowAggregate(values, windowSize)
+	column = getattr(stats, stat)
+	return {x_name: list(range(1, len(column) + 1)), y_name: column.tolist()}